@@ -1,18 +1,26 @@
-import sqlite3
+import asyncio
 from datetime import datetime
-from langchain.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.docstore.document import Document
-from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
 import os
 import requests
 import json
+import threading
+import time
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from alert_dispatcher import AlertDispatcher
+from prescoring import PreScorer
+from verdict_cache import VerdictCache
+# LangChain, the embedding model, FAISS and NumPy are imported by FraudAgentService on first use
 
 # Load environment variables
 load_dotenv()
 
+# History context for the LLM: "vector" retrieves similar past transactions through the
+# embedding index, "structured" renders recent history and aggregates from SQLite as a table
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "vector")
+if CONTEXT_MODE not in ("vector", "structured"):
+    raise ValueError(f"Unknown CONTEXT_MODE {CONTEXT_MODE!r}; expected 'vector' or 'structured'")
+
 def empty():
     pass
 # SlackReporter class for fraud alerts
@@ -21,15 +29,34 @@ class SlackReporter:
         self.webhook_url = os.getenv("SLACK_WEBHOOK_URL")
         self.bot_token = os.getenv("SLACK_BOT_TOKEN")
         self.default_channel = os.getenv("SLACK_DEFAULT_CHANNEL", "fraud-alerts")
+        # Overridable so delivery can be exercised against a local stub server
+        self.api_url = os.getenv("SLACK_API_URL", "https://slack.com/api/chat.postMessage")
+        self.timeout = float(os.getenv("SLACK_TIMEOUT", "5"))
+        
+        # One pooled session keeps connections to Slack alive between alerts
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    
+    @property
+    def configured(self):
+        return bool(self.webhook_url or self.bot_token)
     
     def send_alert(self, transaction_data, analysis):
         """Send formatted fraud alert to Slack"""
-        if not self.webhook_url and not self.bot_token:
+        return self.send_alerts([(transaction_data, analysis)])
+    
+    def send_alerts(self, alerts):
+        """Send one Slack message covering a list of (transaction_data, analysis) pairs"""
+        if not self.configured:
             print("Slack credentials not configured. Would have sent a Slack alert.")
             return {"error": "Slack credentials not configured"}
         
         # Format the alert blocks for Slack
-        blocks = self._format_alert_blocks(transaction_data, analysis)
+        if len(alerts) == 1:
+            blocks = self._format_alert_blocks(*alerts[0])
+        else:
+            blocks = self._format_grouped_alert_blocks(alerts)
         
         # Use appropriate sending method
         if self.bot_token:
@@ -50,10 +77,11 @@ class SlackReporter:
             "blocks": blocks
         }
         
-        response = requests.post(
-            "https://slack.com/api/chat.postMessage",
+        response = self.session.post(
+            self.api_url,
             headers=headers,
-            data=json.dumps(payload)
+            data=json.dumps(payload),
+            timeout=self.timeout
         )
         
         return response.json()
@@ -65,10 +93,11 @@ class SlackReporter:
             "blocks": blocks
         }
         
-        response = requests.post(
+        response = self.session.post(
             self.webhook_url,
             data=json.dumps(payload),
-            headers={'Content-Type': 'application/json'}
+            headers={'Content-Type': 'application/json'},
+            timeout=self.timeout
         )
         
         return {"status": response.status_code, "text": response.text}
@@ -130,19 +159,66 @@ class SlackReporter:
         ]
         
         return blocks
+    
+    def _format_grouped_alert_blocks(self, alerts, max_listed=10):
+        """Format several alerts for the same customer into one message"""
+        first = alerts[0][0]
+        blocks = [
+            {
+                "type": "header",
+                "text": {
+                    "type": "plain_text",
+                    "text": f"🚨 FRAUD ALERT: {len(alerts)} Suspicious Transactions",
+                    "emoji": True
+                }
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"*Customer:*\n{first['CustomerID']}"
+                }
+            }
+        ]
+        
+        for transaction_data, analysis in alerts[:max_listed]:
+            blocks.append({"type": "divider"})
+            blocks.append({
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": (
+                        f"*${transaction_data['Amount']}* to {transaction_data['CustomerID2']} "
+                        f"on {transaction_data['Date']} at {transaction_data['Time']} "
+                        f"from IP {transaction_data['IP']}\n"
+                        # Slack caps a section's text at 3000 characters
+                        f"*AI Analysis:*\n{analysis[:1500]}"
+                    )
+                }
+            })
+        
+        if len(alerts) > max_listed:
+            blocks.append({
+                "type": "context",
+                "elements": [{"type": "mrkdwn", "text": f"...and {len(alerts) - max_listed} more"}]
+            })
+        
+        return blocks
 
 # Define action tools
 class FraudDetectionTools:
     def __init__(self):
         self.slack_reporter = SlackReporter()
+        # Delivery happens on a background thread so Slack never stalls scoring
+        self.alert_dispatcher = AlertDispatcher(self.slack_reporter).start()
     
     def send_slack_alert(self, transaction_data, analysis):
         """Send a Slack alert for highly suspicious transactions"""
         print(f"\n🚨 SENDING SLACK ALERT 🚨")
         print(f"Transaction: {transaction_data['CustomerID']} to {transaction_data['CustomerID2']} for ${transaction_data['Amount']}")
         
-        # Try to send to Slack if credentials are available
-        self.slack_reporter.send_alert(transaction_data, analysis)
+        # Queue for Slack if credentials are available
+        self.alert_dispatcher.enqueue(transaction_data, analysis)
         return "Slack alert sent for suspicious transaction."
     
     def flag_to_admin(self, transaction_data, analysis):
@@ -154,95 +230,229 @@ class FraudDetectionTools:
 # Set API key
 os.environ["GROQ_API_KEY"] = "..."
 
-# Step 1: Load previous transactions from SQLite
-conn = sqlite3.connect("transactions.db")
-cursor = conn.cursor()
-# Fixed column names to match database schema
-cursor.execute("SELECT ID, CustomerID, CustomerID2, Amount, Date, Time, IP FROM transactions")
-rows = cursor.fetchall()
-conn.close()
-
-print(f"Total transactions loaded from database: {len(rows)}")
-customer_counts = {}
-for row in rows:
-    customer_id = row[1]  # CustomerID is at index 1
-    customer_counts[customer_id] = customer_counts.get(customer_id, 0) + 1
-
-print(f"Transactions per customer:")
-for customer, count in customer_counts.items():
-    print(f"- {customer}: {count} transactions")
-    
-# Step 2: Convert transactions to documents
-docs = []
-for row in rows:
-    # Match variable names with actual column names
-    txn_id, customer_id, customer_id2, amount, date, time, ip = row
-    content = (
-        f"Transaction by {customer_id} to {customer_id2} of ${amount} on {date} at {time} from IP {ip}."
-    )
-    docs.append(Document(page_content=content, metadata={"txn_id": txn_id, "customer_id": customer_id}))
-# Step 3: Embed the documents using HuggingFaceEmbeddings
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = FAISS.from_documents(docs, embeddings)
-general_retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-
-# Step 4: Use Groq + LLaMA 3
-llm = ChatGroq(model_name="llama3-70b-8192", temperature=0.2)
-qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=general_retriever)
-
-# Initialize tools
-tools = FraudDetectionTools()
-
-# Step 5: Define the agent evaluation function with actions
+class FraudAgentService:
+    """The evaluation pipeline's components, each built on first use.
+
+    Importing this module only defines the service; the pre-screen, feature
+    store, embedding model, vector index, LLM and evaluator are created (and
+    their libraries imported) the first time something needs them, so code
+    that never evaluates a transaction never pays for them. `warm_up()`
+    builds the evaluator and everything it uses on a background thread ahead
+    of the first request.
+
+    An `embeddings` or `llm` passed in is used instead of the default model.
+    """
+
+    def __init__(self, context_mode=CONTEXT_MODE, embeddings=None, llm=None):
+        self.context_mode = context_mode
+        self._components = {}
+        if embeddings is not None:
+            self._components["embeddings"] = embeddings
+        if llm is not None:
+            self._components["llm"] = llm
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._warm_up_thread = None
+
+    def _component(self, name, factory):
+        """Return a component, building it once even when several threads ask at the same time"""
+        component = self._components.get(name)
+        if component is not None:
+            return component
+        with self._locks_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            component = self._components.get(name)
+            if component is None:
+                component = self._components[name] = factory()
+        return component
+
+    def loaded(self, name):
+        """The component if it has been built, else None; never builds it"""
+        return self._components.get(name)
+
+    @property
+    def prescorer(self):
+        return self._component("prescorer", self._load_prescorer)
+
+    def _load_prescorer(self):
+        # Per-customer numeric profiles for the pre-screen that runs before the LLM
+        prescorer = PreScorer()
+        prescorer.sync()
+        return prescorer
+
+    @property
+    def feature_store(self):
+        return self._component("feature_store", self._load_feature_store)
+
+    def _load_feature_store(self):
+        # Columnar per-customer history: last N transactions and 1h/24h/30d rolling aggregates
+        from feature_store import FeatureStore
+        return FeatureStore().load()
+
+    @property
+    def embeddings(self):
+        return self._component("embeddings", self._load_embeddings)
+
+    def _load_embeddings(self):
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        from vector_index import EMBEDDING_MODEL
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+    @property
+    def transaction_index(self):
+        if self.context_mode != "vector":
+            return None
+        return self._component("transaction_index", self._load_transaction_index)
+
+    def _load_transaction_index(self):
+        # Step 1-3: Load the persisted per-customer vector index and embed only transactions added since the last run
+        # (run `python vector_index.py --rebuild` after changing the embedding model)
+        from vector_index import TransactionIndex, EMBEDDING_MODEL
+        return TransactionIndex(self.embeddings, model_name=EMBEDDING_MODEL).load()
+
+    @property
+    def general_retriever(self):
+        if self.context_mode != "vector":
+            return None
+        return self._component("general_retriever", self._load_general_retriever)
+
+    def _load_general_retriever(self):
+        from vector_index import TransactionRetriever
+        return TransactionRetriever(index=self.transaction_index, k=5)
+
+    @property
+    def index_updater(self):
+        if self.context_mode != "vector":
+            return None
+        return self._component("index_updater", self._load_index_updater)
+
+    def _load_index_updater(self):
+        # New transactions are embedded by a background thread as app.py inserts them
+        from vector_index import IndexUpdater
+        return IndexUpdater(self.transaction_index).start()
+
+    @property
+    def context_builder(self):
+        if self.context_mode != "structured":
+            return None
+        return self._component("context_builder", self._load_context_builder)
+
+    def _load_context_builder(self):
+        # No embedding model or vector index is loaded; the context comes straight from SQLite
+        from context_builder import StructuredContextBuilder
+        return StructuredContextBuilder(feature_store=self.feature_store)
+
+    @property
+    def llm(self):
+        return self._component("llm", self._load_llm)
+
+    def _load_llm(self):
+        # Step 4: Use Groq + LLaMA 3
+        from langchain_groq import ChatGroq
+        return ChatGroq(model_name="llama3-70b-8192", temperature=0.2)
+
+    @property
+    def qa_chain(self):
+        if self.general_retriever is None:
+            return None
+        return self._component("qa_chain", self._load_qa_chain)
+
+    def _load_qa_chain(self):
+        from langchain.chains import RetrievalQA
+        return RetrievalQA.from_chain_type(llm=self.llm, retriever=self.general_retriever)
+
+    @property
+    def tools(self):
+        return self._component("tools", FraudDetectionTools)
+
+    @property
+    def verdict_cache(self):
+        # Verdicts for near-identical transactions are reused instead of calling the LLM again
+        return self._component("verdict_cache", VerdictCache)
+
+    @property
+    def evaluator(self):
+        return self._component("evaluator", self._load_evaluator)
+
+    def _load_evaluator(self):
+        # Step 5: Build the evaluator once; it reuses the same chain for every transaction
+        from evaluator import TransactionEvaluator
+        # In vector mode this also starts the updater that keeps the index current
+        self.index_updater
+        return TransactionEvaluator(self.llm, self.transaction_index, self.tools, prescorer=self.prescorer,
+                                    cache=self.verdict_cache, k=5, context_builder=self.context_builder)
+
+    def warm_up(self):
+        """Build the evaluator and its components on a background thread; returns the thread (join it to wait)"""
+        if self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(target=self._warm_up, name="agent-warm-up", daemon=True)
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            self.evaluator
+        except Exception as e:
+            # The first request retries the failed component and reports the error itself
+            print(f"Agent warm-up failed: {e}")
+            return
+        print(f"Agent warmed up in {time.perf_counter() - start:.1f}s")
+
+    def ingest(self):
+        """Catch up the components that are already built with newly inserted rows.
+
+        Components built later read the whole table when they load, so nothing is lost.
+        """
+        for name in ("prescorer", "feature_store"):
+            component = self.loaded(name)
+            if component is not None:
+                component.sync()
+        if self.loaded("transaction_index") is not None:
+            self.index_updater.notify()
+
+service = FraudAgentService()
+
+# The components used to be module globals; keep `agent.evaluator` etc. working without building them at import
+_SERVICE_ATTRIBUTES = {"prescorer", "feature_store", "embeddings", "transaction_index", "general_retriever",
+                       "index_updater", "context_builder", "llm", "qa_chain", "tools", "verdict_cache", "evaluator"}
+
+def __getattr__(name):
+    if name in _SERVICE_ATTRIBUTES:
+        return getattr(service, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Start building the agent's components in the background; returns the warm-up thread"""
+    return service.warm_up()
+
 def evaluate_transaction(new_txn):
-    customer_id = new_txn['CustomerID']
-    
-    # Create customer-specific retriever with metadata filtering
-    customer_retriever = vectorstore.as_retriever(
-        search_kwargs={
-            "k": 5,
-            "filter": {"customer_id": customer_id}  # Only retrieve this customer's transactions
-        }
-    )
-    
-    # Create a customer-specific chain
-    customer_qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=customer_retriever)
-    prompt = f"""
-You are a fraud detection agent. A new transaction has occurred:
+    """Evaluate a transaction against the customer's history and take the chosen action"""
+    return service.evaluator.evaluate(new_txn)
 
-CustomerID: {new_txn['CustomerID']}
-To: {new_txn['CustomerID2']}
-Amount: ${new_txn['Amount']}
-Date: {new_txn['Date']}
-Time: {new_txn['Time']}
-IP Address: {new_txn['IP']}
+async def aevaluate_transaction(new_txn):
+    """Async variant of evaluate_transaction for use inside an event loop"""
+    return await service.evaluator.aevaluate(new_txn)
 
-Based on the customer's historical behavior, evaluate if this transaction is normal or suspicious.
+def evaluate_transactions(new_txns):
+    """Evaluate a batch of transactions concurrently, returning results in the same order.
 
-IMPORTANT: First provide a detailed analysis explaining your reasoning. Then determine the appropriate action by concluding with one of these exact phrases:
-- "ACTION: No action required" - If transaction is within normal patterns
-- "ACTION: Flag to admin" - If transaction shows slight deviation from normal patterns
-- "ACTION: Send Slack alert" - If transaction shows strong anomalies
+    Runs its own event loop, so call aevaluate_transaction from async code instead.
+    """
+    return asyncio.run(service.evaluator.aevaluate_many(new_txns))
 
-Your analysis must clearly explain the factors that led to your decision.
-"""
+def verdict_cache_stats():
+    """Hit/miss counters of the LLM verdict cache"""
+    return service.verdict_cache.stats()
 
-    response = customer_qa_chain.run(prompt)
-    
-    # Extract the analysis part (everything before the ACTION line)
-    analysis_parts = response.split("ACTION:")
-    analysis = analysis_parts[0].strip()
-    
-    # Determine which action to take
-    if "Send Slack alert" in response:
-        action_result = tools.send_slack_alert(new_txn, analysis)
-    elif "Flag to admin" in response:
-        action_result = tools.flag_to_admin(new_txn, analysis)
-    else:
-        action_result = "No action required for this transaction."
-    
-    # Return the full response with analysis and action taken
-    return f"{response}\n\nSystem: {action_result}"
+def ingest_transaction():
+    """Fold transactions just inserted into the database into the pre-screen profiles, the feature store and the live vector index.
+
+    Returns quickly; embedding (vector context mode only) happens on the index updater thread.
+    Components not built yet are skipped; they load the new rows when first used.
+    """
+    service.ingest()
 
 # Step 6: Test Anomalous Transaction
 # test_txn = {
@@ -0,0 +1,159 @@
+# alert_dispatcher.py
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import database
+
+OUTBOX_DB = os.getenv("ALERT_OUTBOX_DB", database.DB_PATH)
+COALESCE_WINDOW = float(os.getenv("ALERT_COALESCE_WINDOW", "10"))  # seconds to gather alerts per customer
+MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = 2.0  # seconds; doubled after every failed delivery
+BACKOFF_MAX = 300.0
+SENDING_LEASE = 120.0  # seconds before a batch stuck in 'sending' is retried
+
+
+class AlertDispatcher:
+    """Delivers Slack alerts from a SQLite outbox on a background thread.
+
+    `enqueue()` only writes an outbox row, so the evaluation path never waits
+    on Slack. Alerts for the same customer that arrive within the coalesce
+    window go out as a single message. Failed deliveries are retried with
+    jittered exponential backoff, and rows still pending when the process
+    stops are delivered after a restart.
+    """
+
+    def __init__(self, reporter, db_path=OUTBOX_DB, coalesce_window=COALESCE_WINDOW, max_attempts=MAX_ATTEMPTS):
+        self.reporter = reporter
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        # The alert_outbox table is created by the schema migrations
+        database.migrate(db_path)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def enqueue(self, transaction_data, analysis):
+        """Record an alert for delivery and return immediately"""
+        if not self.reporter.configured:
+            print("Slack credentials not configured. Would have sent a Slack alert.")
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO alert_outbox (customer_id, transaction_data, analysis, created_at, next_attempt_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (transaction_data['CustomerID'], json.dumps(transaction_data), analysis, now, now)
+            )
+        self._wakeup.set()
+
+    def dispatch_due(self, now=None):
+        """Send every customer batch that is due; returns the number of messages sent"""
+        now = time.time() if now is None else now
+        sent = 0
+        for customer_id, rows in self._claim_due(now):
+            alerts = [(json.loads(data), analysis) for _, data, analysis, _ in rows]
+            try:
+                result = self.reporter.send_alerts(alerts)
+                if not _delivered(result):
+                    raise RuntimeError(f"Slack rejected the alert: {result}")
+            except Exception as e:
+                self._reschedule(rows, str(e), now)
+                print(f"Slack delivery for {customer_id} failed: {e}")
+                continue
+
+            sent_at = time.time()
+            with self.lock:
+                self.conn.executemany(
+                    "UPDATE alert_outbox SET state = 'sent', sent_at = ? WHERE id = ?",
+                    [(sent_at, row[0]) for row in rows]
+                )
+            sent += 1
+        return sent
+
+    def _claim_due(self, now):
+        """Mark due alerts as 'sending' and group them by customer"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Batches whose sender died mid-delivery go back to pending
+                self.conn.execute(
+                    "UPDATE alert_outbox SET state = 'pending' WHERE state = 'sending' AND claimed_at < ?",
+                    (now - SENDING_LEASE,)
+                )
+                customers = [row[0] for row in self.conn.execute('''
+                    SELECT customer_id FROM alert_outbox
+                    WHERE state = 'pending'
+                    GROUP BY customer_id
+                    HAVING MIN(created_at) <= ? AND MAX(next_attempt_at) <= ?
+                ''', (now - self.coalesce_window, now))]
+
+                batches = []
+                for customer_id in customers:
+                    rows = self.conn.execute(
+                        "SELECT id, transaction_data, analysis, attempts FROM alert_outbox "
+                        "WHERE state = 'pending' AND customer_id = ? ORDER BY id",
+                        (customer_id,)
+                    ).fetchall()
+                    self.conn.executemany(
+                        "UPDATE alert_outbox SET state = 'sending', claimed_at = ? WHERE id = ?",
+                        [(now, row[0]) for row in rows]
+                    )
+                    batches.append((customer_id, rows))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return batches
+
+    def _reschedule(self, rows, error, now):
+        attempts = max(row[3] for row in rows) + 1
+        if attempts >= self.max_attempts:
+            state, next_attempt_at = 'failed', None
+        else:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+            state, next_attempt_at = 'pending', now + delay * random.uniform(0.5, 1.5)
+        with self.lock:
+            self.conn.executemany(
+                'UPDATE alert_outbox SET state = ?, attempts = ?, error = ?, next_attempt_at = ? WHERE id = ?',
+                [(state, attempts, error, next_attempt_at, row[0]) for row in rows]
+            )
+
+    def _next_wakeup(self, now):
+        with self.lock:
+            # A customer's batch is due under the same rule as in _claim_due
+            row = self.conn.execute('''
+                SELECT MIN(due_at) FROM (
+                    SELECT MAX(MIN(created_at) + ?, MAX(next_attempt_at)) AS due_at
+                    FROM alert_outbox WHERE state = 'pending'
+                    GROUP BY customer_id
+                )
+            ''', (self.coalesce_window,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - now)
+
+    def _run(self):
+        while True:
+            try:
+                self.dispatch_due()
+                timeout = self._next_wakeup(time.time())
+            except Exception as e:
+                print(f"Alert dispatcher error: {e}")
+                timeout = BACKOFF_BASE
+            self._wakeup.wait(timeout=SENDING_LEASE if timeout is None else timeout)
+            self._wakeup.clear()
+
+
+def _delivered(result):
+    """Slack's Web API answers {"ok": true}; incoming webhooks answer HTTP 200"""
+    if not isinstance(result, dict):
+        return False
+    return result.get("ok") is True or result.get("status") == 200
@@ -1,27 +1,168 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, abort, g, has_request_context
+import base64
+import os
 import sqlite3
 import json
+import threading
 from datetime import datetime
-from agent import evaluate_transaction
+from queue import Empty, LifoQueue
+from agent import evaluate_transaction, ingest_transaction, verdict_cache_stats, warm_up
+import database
+import scoring_queue
+
+# With ASYNC_SCORING=1 new transactions are saved as 'pending' and scored by background workers
+ASYNC_SCORING = os.getenv("ASYNC_SCORING", "0") == "1"
+
+# Load the models and indexes in the background at startup instead of on the first evaluation
+AGENT_WARM_UP = os.getenv("AGENT_WARM_UP", "1") == "1"
+
+# Idle SQLite connections kept for requests; the dev server runs every request on a new thread
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
 
 app = Flask(__name__)
 
+# Schema and indexes are brought up to date once per process at import, under any WSGI server
+database.migrate()
+
+_idle = LifoQueue()
+_local = threading.local()
+
+def _checkout():
+    try:
+        return _idle.get_nowait()
+    except Empty:
+        conn = database.connect(check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
 def get_db_connection():
-    conn = sqlite3.connect('transactions.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """A pooled connection, held by the request until it ends; background threads keep their own"""
+    if not has_request_context():
+        conn = getattr(_local, 'conn', None)
+        if conn is None:
+            conn = _local.conn = _checkout()
+        return conn
+    if 'db' not in g:
+        g.db = _checkout()
+    return g.db
+
+@app.teardown_request
+def release_connection(exc):
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    # A request that failed mid-write must not leave its transaction open on a pooled connection
+    if conn.in_transaction:
+        conn.rollback()
+    if _idle.qsize() < DB_POOL_SIZE:
+        _idle.put(conn)
+    else:
+        conn.close()
+
+def result_status(result):
+    """Split an evaluation result into the stored status and explanation"""
+    status = "normal"
+    if "Send Slack alert" in result:
+        status = "alert"  # Red
+    elif "Flag to admin" in result:
+        status = "flag"   # Yellow
+    
+    # Get the explanation part
+    explanation = result.split("\n\nSystem:")[0] if "\n\nSystem:" in result else result
+    return status, explanation
+
+def save_result(txn_rowid, result):
+    """Store a background evaluation result on its transaction"""
+    status, explanation = result_status(result)
+    conn = get_db_connection()
+    conn.execute('UPDATE transactions SET status = ?, explanation = ? WHERE rowid = ?',
+                 (status, explanation, txn_rowid))
+    conn.commit()
+    ingest_transaction()
+
+def save_failure(txn_rowid, error):
+    conn = get_db_connection()
+    conn.execute('UPDATE transactions SET status = ?, explanation = ? WHERE rowid = ?',
+                 ("error", f"Evaluation failed: {error}", txn_rowid))
+    conn.commit()
+    ingest_transaction()
+
+def encode_cursor(row):
+    raw = json.dumps([row['Date'], row['Time'], row['rowid']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        date, time_, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return date, time_, int(rowid)
+    except (ValueError, TypeError):
+        abort(400, "Invalid cursor")
+
+def list_transactions(conn, status=None, customer=None, cursor=None, limit=PAGE_SIZE):
+    """One page of transactions, newest first, and the cursor of the next page (or None).
+
+    Pages are keyed on (Date, Time, rowid) rather than offsets, so every page
+    is an index range scan however deep it is. rowid breaks ties because rows
+    added through the form have no ID.
+    """
+    clauses, params = [], []
+    if status:
+        clauses.append('status = ?')
+        params.append(status)
+    if customer:
+        clauses.append('CustomerID = ?')
+        params.append(customer)
+    if cursor:
+        clauses.append('(Date, Time, rowid) < (?, ?, ?)')
+        params.extend(decode_cursor(cursor))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    
+    rows = conn.execute(f'''
+        SELECT rowid, * FROM transactions {where}
+        ORDER BY Date DESC, Time DESC, rowid DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def page_args():
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    return {
+        'status': request.args.get('status') or None,
+        'customer': request.args.get('customer') or None,
+        'cursor': request.args.get('cursor') or None,
+        'limit': max(1, min(limit, MAX_PAGE_SIZE))
+    }
+
+# Jobs left queued by a previous process are resumed as soon as the workers start. Without
+# ASYNC_SCORING the workers only drain those and exit: the history indexes stop at the first
+# pending row, so leftovers from an earlier async run would otherwise hold them back for good
+_scoring = scoring_queue.ScoringQueue(evaluate_transaction, save_result, save_failure,
+                                      drain_only=not ASYNC_SCORING).start()
+queue = _scoring if ASYNC_SCORING else None
+
+if AGENT_WARM_UP:
+    warm_up()
 
 @app.route('/')
 def dashboard():
+    args = page_args()
     conn = get_db_connection()
-    # Simply read transactions with their stored status from the database
-    transactions = conn.execute('''
-        SELECT * FROM transactions 
-        ORDER BY Date DESC, Time DESC
-    ''').fetchall()
-    conn.close()
+    # One page of transactions with their stored status
+    transactions, next_cursor = list_transactions(conn, **args)
     
-    return render_template('dashboard.html', transactions=transactions)
+    return render_template('dashboard.html', transactions=transactions, next_cursor=next_cursor,
+                           status=args['status'], customer=args['customer'], limit=args['limit'],
+                           paged=args['cursor'] is not None)
+
+@app.route('/api/transactions')
+def transactions_api():
+    conn = get_db_connection()
+    transactions, next_cursor = list_transactions(conn, **page_args())
+    return jsonify({"transactions": [dict(row) for row in transactions], "next_cursor": next_cursor})
 
 @app.route('/new-transaction', methods=['GET', 'POST'])
 def new_transaction():
@@ -38,18 +179,26 @@ def new_transaction():
         "IP": request.form['ip']
     }
     
+    if queue is not None:
+        # Save right away and let a scoring worker evaluate it
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO transactions (CustomerID, CustomerID2, Amount, Date, Time, IP, status, explanation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (txn_data["CustomerID"], txn_data["CustomerID2"], txn_data["Amount"], 
+             txn_data["Date"], txn_data["Time"], txn_data["IP"], "pending", None)
+        )
+        txn_id = cursor.lastrowid
+        scoring_queue.enqueue(conn, txn_id, txn_data)
+        conn.commit()
+        queue.notify()
+        return redirect(url_for('transaction_detail', txn_id=txn_id))
+    
     # THIS IS WHERE WE EVALUATE - only for new transactions
     result = evaluate_transaction(txn_data)
     
     # Extract status and explanation
-    status = "normal"
-    if "Send Slack alert" in result:
-        status = "alert"  # Red
-    elif "Flag to admin" in result:
-        status = "flag"   # Yellow
-    
-    # Get the explanation part
-    explanation = result.split("\n\nSystem:")[0] if "\n\nSystem:" in result else result
+    status, explanation = result_status(result)
     
     # Save to database with the evaluation result
     conn = get_db_connection()
@@ -61,32 +210,34 @@ def new_transaction():
 )
     txn_id = cursor.lastrowid
     conn.commit()
-    conn.close()
+    
+    # Make the new transaction part of this customer's history for later evaluations
+    ingest_transaction()
     
     return redirect(url_for('transaction_detail', txn_id=txn_id))
 
 @app.route('/transaction/<txn_id>')
 def transaction_detail(txn_id):
     conn = get_db_connection()
-    transaction = conn.execute('SELECT * FROM transactions WHERE ID = ?', 
-                          (txn_id,)).fetchone()
-    conn.close()
-    
+    # Rows added through the form have no ID and are addressed by rowid instead
+    transaction = conn.execute('SELECT * FROM transactions WHERE ID = ? OR (ID IS NULL AND rowid = ?)', 
+                          (txn_id, txn_id)).fetchone()
+    job = None
+    if transaction is not None and transaction['status'] == 'pending':
+        job = conn.execute('''
+            SELECT state, attempts, error FROM scoring_jobs
+            WHERE txn_rowid = (SELECT rowid FROM transactions WHERE ID = ? OR (ID IS NULL AND rowid = ?))
+            ORDER BY id DESC LIMIT 1
+        ''', (txn_id, txn_id)).fetchone()
+
     if transaction is None:
         return "Transaction not found", 404
-        
-    return render_template('transaction_detail.html', transaction=transaction)
+
+    return render_template('transaction_detail.html', transaction=transaction, job=job)
+
+@app.route('/api/verdict-cache')
+def verdict_cache():
+    return jsonify(verdict_cache_stats())
 
 if __name__ == '__main__':
-    # Make sure new DB columns exist
-    conn = get_db_connection()
-    try:
-        conn.execute('ALTER TABLE transactions ADD COLUMN status TEXT DEFAULT "normal"')
-        conn.execute('ALTER TABLE transactions ADD COLUMN explanation TEXT')
-        conn.commit() 
-    except sqlite3.OperationalError:
-        # Columns already exist
-        pass
-    conn.close()
-    
     app.run(debug=True)
@@ -0,0 +1,102 @@
+# benchmarks/bench_agent_startup.py
+"""Import time and time to first request of agent.py and the Flask app.
+
+Each measurement runs in a fresh interpreter, in a scratch directory holding
+a copy of the database, so nothing is cached from an earlier run:
+
+  import agent       importing the module (components are built lazily)
+  import app         importing the Flask app, with AGENT_WARM_UP=0
+  first GET /        the dashboard route, which only reads the database
+  warm-up            FraudAgentService.warm_up() until every component is built
+  first evaluation   evaluate() right after the warm-up
+
+The warm-up uses fake embeddings and a fake LLM unless --live is given, in
+which case it loads the MiniLM model and builds ChatGroq. Before the service
+was lazy, the import paid for the warm-up as well.
+
+    python benchmarks/bench_agent_startup.py [--runs 3] [--live]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+TXN = {
+    "CustomerID": "CUST001",
+    "CustomerID2": "CUST002",
+    "Amount": 5000,
+    "Date": "2025-05-12",
+    "Time": "13:00",
+    "IP": "192.168.1.8"
+}
+
+
+def measure(live):
+    """One run; executes in its own interpreter"""
+    result = {}
+    start = time.perf_counter()
+    import agent
+    result["import agent"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    import app
+    result["import app"] = time.perf_counter() - start
+
+    client = app.app.test_client()
+    start = time.perf_counter()
+    client.get("/")
+    result["first GET /"] = time.perf_counter() - start
+
+    if live:
+        service = agent.FraudAgentService()
+    else:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        from langchain_community.llms.fake import FakeListLLM
+        service = agent.FraudAgentService(embeddings=DeterministicFakeEmbedding(size=384),
+                                          llm=FakeListLLM(responses=["Usual pattern.\n\nACTION: No action required"]))
+    start = time.perf_counter()
+    service.warm_up().join()
+    result["warm-up"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    service.evaluator.evaluate(TXN)
+    result["first evaluation"] = time.perf_counter() - start
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--db", default=os.path.join(REPO, "transactions.db"))
+    parser.add_argument("--live", action="store_true", help="warm up with the MiniLM embedding model and Groq")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        measure(args.live)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            shutil.copy(args.db, os.path.join(scratch, "transactions.db"))
+            env = dict(os.environ, AGENT_WARM_UP="0", PYTHONPATH=REPO)
+            command = [sys.executable, os.path.abspath(__file__), "--run"] + (["--live"] if args.live else [])
+            output = subprocess.run(command, cwd=scratch, env=env, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.runs} runs, {'live models' if args.live else 'fake LLM, fake embeddings'} (median seconds)")
+    for step in results[0]:
+        print(f"  {step:<18} {statistics.median(run[step] for run in results):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
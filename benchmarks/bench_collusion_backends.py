@@ -0,0 +1,100 @@
+# benchmarks/bench_collusion_backends.py
+"""Memory and throughput of the collusion graph backends.
+
+Builds the relationship graph from --transactions synthetic transactions,
+most of which create a new employee-customer edge, with each backend in
+collusion_graph. Reports the memory held by the graph (tracemalloc, which
+also sees NumPy buffers) and the per-transaction cost of the detector's
+graph path: add the edge, then read its weight and the employee aggregates.
+
+The same transactions, one per --seconds-apart, are also fed to the ring
+search's flow index with its eviction sweeps. It holds about two cycle
+windows of flows whatever the history length, and its memory is added to
+each backend's in the "with flows" column, since the detector keeps both.
+
+    python benchmarks/bench_collusion_backends.py [--transactions 1000000] [--window-hours 24]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from collusion_flows import FlowClock, FlowIndex
+from collusion_graph import BACKENDS
+
+
+def transactions(count, employees):
+    for i in range(count):
+        # Every 10th transaction repeats one of 100 hot pairs
+        j = (i // 10) % 100 if i % 10 == 0 else i
+        yield f"emp_{j % employees}", f"cust_{j}"
+
+
+def ingest(graph, count, employees):
+    for emp_id, cust_id in transactions(count, employees):
+        graph.add(emp_id, cust_id)
+        graph.weight(emp_id, cust_id)
+        graph.aggregates(emp_id)
+
+
+def ingest_flows(count, employees, seconds_apart, window_seconds):
+    """Returns (flow index, edges dropped by eviction)"""
+    flows, clock, dropped = FlowIndex(max_fanout=64), FlowClock(window_seconds), 0
+    for i, (emp_id, cust_id) in enumerate(transactions(count, employees)):
+        ts = i * seconds_apart
+        clock.observe(ts)
+        flows.record(emp_id, cust_id, ts, i, f"tx_{i}", 1.0)
+        cutoff = clock.sweep_cutoff()
+        if cutoff is not None:
+            dropped += flows.evict(cutoff)
+    return flows, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--employees", type=int, default=20_000)
+    parser.add_argument("--seconds-apart", type=float, default=1.0)
+    parser.add_argument("--window-hours", type=float, default=24.0)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    flows, dropped = ingest_flows(args.transactions, args.employees, args.seconds_apart, args.window_hours * 3600)
+    flow_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    held = sum(len(events) for preds in flows.pred.values() for events in preds.values())
+    print(f"flow index ({args.window_hours:g}h window): {held:,} flows on {flows.number_of_edges():,} edges held, "
+          f"{dropped:,} edges evicted, {flow_memory / 1e6:.1f} MB ({flow_memory / max(held, 1):.0f} bytes/flow)")
+    del flows
+    gc.collect()
+
+    print(f"{'backend':>9} {'edges':>10} {'memory MB':>10} {'bytes/edge':>11} {'us/tx':>7} {'with flows MB':>14}")
+    for name, backend in BACKENDS.items():
+        graph = backend()
+        start = time.perf_counter()
+        ingest(graph, args.transactions, args.employees)
+        us_per_tx = (time.perf_counter() - start) / args.transactions * 1e6
+        edges = graph.number_of_edges()
+        del graph
+        gc.collect()
+
+        # Memory is measured on a second build, since tracing slows allocation down
+        tracemalloc.start()
+        graph = backend()
+        ingest(graph, args.transactions, args.employees)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del graph
+        gc.collect()
+
+        print(f"{name:>9} {edges:>10,} {memory / 1e6:>10.1f} {memory / edges:>11.0f} {us_per_tx:>7.2f} "
+              f"{(memory + flow_memory) / 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
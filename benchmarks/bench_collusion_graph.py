@@ -0,0 +1,58 @@
+# benchmarks/bench_collusion_graph.py
+"""Per-transaction cost of CollusionDetector._update_graph as the graph grows.
+
+Ingests --transactions transactions, nearly all of which create a new
+employee-customer edge, reporting the average update cost at each
+checkpoint next to the cost of the full edge scan the detector used to run
+on every update to find the maximum weight.
+
+    python benchmarks/bench_collusion_graph.py [--transactions 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def legacy_max_scan(graph):
+    return max((w for _, _, w in graph.edges()), default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--employees", type=int, default=1000)
+    args = parser.parse_args()
+
+    # collusion_app opens collusion.db in the working directory on import
+    os.chdir(tempfile.mkdtemp())
+    import collusion_app
+
+    detector = collusion_app.detector
+    checkpoints = sorted({n for n in (10_000, 100_000, args.transactions) if n <= args.transactions})
+    print(f"{'transactions':>12} {'edges':>10} {'update us/tx':>14} {'legacy scan us/tx':>18} {'max_weight':>11}")
+
+    done = 0
+    for checkpoint in checkpoints:
+        batch = checkpoint - done
+        start = time.perf_counter()
+        for i in range(done, checkpoint):
+            # Every 10th transaction repeats one of 100 hot pairs so the maximum keeps growing
+            j = (i // 10) % 100 if i % 10 == 0 else i
+            detector._update_graph((f"tx_{i}", f"emp_{j % args.employees}", f"cust_{j}"))
+        update_us = (time.perf_counter() - start) / batch * 1e6
+        done = checkpoint
+
+        start = time.perf_counter()
+        legacy_max_scan(detector.graph)
+        scan_us = (time.perf_counter() - start) * 1e6
+
+        print(f"{checkpoint:>12,} {detector.graph.number_of_edges():>10,} {update_us:>14.1f} {scan_us:>18,.0f} {detector.max_weight:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_collusion_shards.py
+"""Ingest throughput of the collusion detector by number of shards.
+
+Feeds the same synthetic transactions through CollusionDetector.process_batch
+for each --shards value (0 is the single-process detector), each run in a
+fresh process and database, and reports transactions per second. Separately
+reports the graph engine alone (ShardPool.apply without the SQLite writes),
+which is the part that is spread across processes.
+
+    python benchmarks/bench_collusion_shards.py [--shards 0 2 4] [--transactions 200000]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def workload(count, nodes, seed=42):
+    """Random flows between `nodes` accounts, one per second, so rings of every length keep appearing"""
+    rnd = random.Random(seed)
+    start = 1_700_000_000
+    return [{
+        'transaction_id': f"tx_{i}",
+        'employee_id': f"node_{rnd.randrange(nodes)}",
+        'customer_id': f"node_{rnd.randrange(nodes)}",
+        'amount': rnd.randrange(100, 10_000),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(start + i)),
+    } for i in range(count)]
+
+
+def run(args):
+    """Measure one configuration; runs in its own process because collusion_app configures itself on import"""
+    os.environ['COLLUSION_SHARDS'] = str(args.run)
+    os.chdir(tempfile.mkdtemp())
+    import collusion_app
+
+    txs = workload(args.transactions, args.nodes)
+    detector = collusion_app.detector
+    start = time.perf_counter()
+    for i in range(0, len(txs), args.batch):
+        detector.process_batch(txs[i:i + args.batch])
+    elapsed = time.perf_counter() - start
+    result = {'shards': args.run, 'tx_per_s': len(txs) / elapsed}
+
+    if args.run > 1:
+        # Same work again on fresh shards, skipping SQLite and the parent-side bookkeeping
+        pool = collusion_app.ShardPool(args.run, collusion_app.CYCLE_MIN_HOPS, collusion_app.CYCLE_MAX_HOPS,
+                                       collusion_app.CYCLE_WINDOW.total_seconds(),
+                                       collusion_app.CYCLE_MAX_FANOUT, collusion_app.CYCLE_MAX_FRONTIER)
+        tuples = [(tx['employee_id'], tx['customer_id'], collusion_app._epoch(tx['timestamp']),
+                   tx['transaction_id'], tx['amount']) for tx in txs]
+        start = time.perf_counter()
+        for i in range(0, len(tuples), args.batch):
+            pool.apply(tuples[i:i + args.batch])
+        result['engine_tx_per_s'] = len(tuples) / (time.perf_counter() - start)
+        pool.close()
+    detector.close()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--nodes", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run(args)
+        return
+
+    print(f"{'shards':>6} {'end-to-end tx/s':>16} {'engine tx/s':>12}")
+    for shards in args.shards:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", str(shards),
+             "--transactions", str(args.transactions), "--nodes", str(args.nodes), "--batch", str(args.batch)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        engine = f"{result['engine_tx_per_s']:,.0f}" if 'engine_tx_per_s' in result else "-"
+        print(f"{shards:>6} {result['tx_per_s']:>16,.0f} {engine:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_context_modes.py
+"""Prompt size and latency of the vector and structured context modes.
+
+Evaluates the same transactions with the history context from the embedding
+index (CONTEXT_MODE=vector) and from SQLite (CONTEXT_MODE=structured), with
+the pre-screen and verdict cache off so every call builds a prompt. Reports
+the setup time of each mode (index load / feature store sync), the prompt
+tokens sent to the model and the per-call latency.
+
+By default a fake LLM and fake embeddings are used, so latencies cover
+context building and chain overhead only. --live uses the MiniLM embedding
+model and Groq (needs GROQ_API_KEY), so they become end-to-end. Tokens are
+counted with tiktoken's cl100k_base encoding when it is installed (close to
+LLaMA 3's tokenizer) and estimated as characters / 4 otherwise. The run
+fails if the structured prompt is on average larger than the vector one.
+
+    python benchmarks/bench_context_modes.py [--samples 50] [--live]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import BaseCallbackHandler
+from context_builder import StructuredContextBuilder
+from evaluator import TransactionEvaluator
+from feature_store import FeatureStore
+from vector_index import EMBEDDING_MODEL, TransactionIndex
+import database
+
+RESPONSE = "Looks like the usual pattern.\n\nACTION: No action required"
+
+
+class PromptRecorder(BaseCallbackHandler):
+    """Keeps the prompts the LLM was called with"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.prompts.extend(prompts)
+
+
+def token_counter():
+    try:
+        import tiktoken
+    except ImportError:
+        return (lambda text: len(text) / 4), "estimated as chars/4"
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return (lambda text: len(encoding.encode(text))), "cl100k_base"
+
+
+def sample_transactions(db_path, samples):
+    """The latest transaction of the `samples` customers with the most history"""
+    conn = database.connect(db_path)
+    rows = conn.execute('''
+        SELECT CustomerID, CustomerID2, Amount, Date, Time, IP FROM transactions
+        WHERE rowid IN (SELECT MAX(rowid) FROM transactions GROUP BY CustomerID ORDER BY COUNT(*) DESC LIMIT ?)
+    ''', (samples,)).fetchall()
+    conn.close()
+    keys = ("CustomerID", "CustomerID2", "Amount", "Date", "Time", "IP")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def make_llm(live, recorder):
+    if live:
+        from langchain_groq import ChatGroq
+        return ChatGroq(model_name="llama3-70b-8192", temperature=0.2, callbacks=[recorder])
+    from langchain_community.llms.fake import FakeListLLM
+    return FakeListLLM(responses=[RESPONSE], callbacks=[recorder])
+
+
+def setup(mode, args, tmp_dir):
+    """Returns (index, context_builder) for a mode"""
+    if mode == "vector":
+        if args.live:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        else:
+            from langchain_community.embeddings import DeterministicFakeEmbedding
+            embeddings = DeterministicFakeEmbedding(size=384)
+        index = TransactionIndex(embeddings, db_path=args.db, index_dir=os.path.join(tmp_dir, "faiss_index"))
+        return index.load(), None
+    store = FeatureStore(db_path=args.db, store_dir=os.path.join(tmp_dir, "feature_store")).load()
+    return None, StructuredContextBuilder(db_path=args.db, feature_store=store)
+
+
+def run(mode, args, txns, count_tokens, tmp_dir):
+    start = time.perf_counter()
+    index, context_builder = setup(mode, args, tmp_dir)
+    setup_s = time.perf_counter() - start
+
+    recorder = PromptRecorder()
+    evaluator = TransactionEvaluator(make_llm(args.live, recorder), index, tools=None, k=5,
+                                     context_builder=context_builder)
+    evaluator.evaluate(txns[0])  # warm up
+    recorder.prompts.clear()
+
+    latencies = []
+    for txn in txns:
+        start = time.perf_counter()
+        evaluator.evaluate(txn)
+        latencies.append((time.perf_counter() - start) * 1000)
+    tokens = [count_tokens(prompt) for prompt in recorder.prompts]
+    return setup_s, statistics.mean(tokens), max(tokens), statistics.median(latencies), max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--db", default="transactions.db")
+    parser.add_argument("--live", action="store_true", help="use the MiniLM embedding model and Groq")
+    args = parser.parse_args()
+
+    count_tokens, tokenizer = token_counter()
+    txns = sample_transactions(args.db, args.samples)
+    print(f"{len(txns)} transactions, {'live models' if args.live else 'fake LLM, fake embeddings'}, "
+          f"tokens {tokenizer}")
+    print(f"{'mode':>10} {'setup s':>8} {'prompt tokens':>14} {'max':>6} {'p50 ms':>8} {'max ms':>8}")
+    prompt_tokens = {}
+    for mode in ("vector", "structured"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            setup_s, mean_tokens, max_tokens, p50, worst = run(mode, args, txns, count_tokens, tmp_dir)
+        prompt_tokens[mode] = mean_tokens
+        print(f"{mode:>10} {setup_s:>8.2f} {mean_tokens:>14.0f} {max_tokens:>6.0f} {p50:>8.2f} {worst:>8.2f}")
+    assert prompt_tokens["structured"] <= prompt_tokens["vector"], \
+        f"structured prompt ({prompt_tokens['structured']:.0f} tokens) is larger than vector ({prompt_tokens['vector']:.0f})"
+
+
+if __name__ == "__main__":
+    main()
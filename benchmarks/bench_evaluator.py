@@ -0,0 +1,73 @@
+# benchmarks/bench_evaluator.py
+"""Per-call overhead of evaluate_transaction, excluding the LLM.
+
+Compares building a retriever + RetrievalQA chain on every call (the old
+evaluate_transaction) against the long-lived TransactionEvaluator. A fake LLM
+and fake embeddings are used so only chain construction and retrieval remain.
+
+    python benchmarks/bench_evaluator.py [--calls 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.chains import RetrievalQA
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.llms.fake import FakeListLLM
+from evaluator import EVALUATION_PROMPT, TransactionEvaluator
+from vector_index import TransactionIndex, TransactionRetriever
+
+TXN = {
+    "CustomerID": "CUST001",
+    "CustomerID2": "CUST002",
+    "Amount": 5000,
+    "Date": "2025-05-12",
+    "Time": "13:00",
+    "IP": "192.168.1.8"
+}
+RESPONSE = "Looks like the usual pattern.\n\nACTION: No action required"
+
+
+def per_call_chain(llm, index, txn):
+    retriever = TransactionRetriever(index=index, k=5, customer_id=txn["CustomerID"])
+    chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
+    return chain.run(EVALUATION_PROMPT.format(**txn))
+
+
+def timed(fn, calls):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--db", default="transactions.db")
+    args = parser.parse_args()
+
+    llm = FakeListLLM(responses=[RESPONSE])
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = TransactionIndex(DeterministicFakeEmbedding(size=384), db_path=args.db, index_dir=index_dir)
+        index.load()
+        evaluator = TransactionEvaluator(llm, index, tools=None, k=5)
+
+        retrieval_us = timed(lambda: evaluator.retrieve(EVALUATION_PROMPT.format(**TXN), TXN), args.calls)
+        rebuilt_us = timed(lambda: per_call_chain(llm, index, TXN), args.calls)
+        reused_us = timed(lambda: evaluator.evaluate(TXN), args.calls)
+
+    print(f"{args.calls} calls, fake LLM, fake embeddings")
+    print(f"  retrieval only:            {retrieval_us:8.1f} us/call")
+    print(f"  chain rebuilt per call:    {rebuilt_us:8.1f} us/call")
+    print(f"  TransactionEvaluator:      {reused_us:8.1f} us/call")
+    print(f"  overhead saved per call:   {rebuilt_us - reused_us:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,77 @@
 # collusion_app.py
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, field_validator
+import asyncio
+import json
+import math
+import os
+import pickle
+import queue
 import sqlite3
-import networkx as nx
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import pandas as pd
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 import uvicorn
-from threading import Thread
+from threading import Lock, Thread
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from typing import List, Dict, Any
+from collusion_flows import FlowClock, FlowIndex, find_rings
+from collusion_graph import make_graph
+from collusion_shards import ShardPool
+
+# Optional graph snapshot used to speed up restarts (e.g. COLLUSION_SNAPSHOT=collusion_graph.pkl)
+SNAPSHOT_PATH = os.getenv("COLLUSION_SNAPSHOT")
+
+# Circular money-flow detection: rings of CYCLE_MIN_HOPS..CYCLE_MAX_HOPS hops, all within CYCLE_WINDOW
+CYCLE_MIN_HOPS = int(os.getenv("COLLUSION_CYCLE_MIN_HOPS", "3"))
+CYCLE_MAX_HOPS = int(os.getenv("COLLUSION_CYCLE_MAX_HOPS", "6"))
+CYCLE_WINDOW = timedelta(hours=float(os.getenv("COLLUSION_CYCLE_WINDOW_HOURS", "168")))
+CYCLE_MAX_FANOUT = int(os.getenv("COLLUSION_CYCLE_MAX_FANOUT", "64"))  # predecessors explored per node
+CYCLE_MAX_FRONTIER = int(os.getenv("COLLUSION_CYCLE_MAX_FRONTIER", "4096"))  # open paths per search and depth
+
+# Relationship graph representation: 'networkx' or the compact 'array' backend (see collusion_graph)
+GRAPH_BACKEND = os.getenv("COLLUSION_GRAPH_BACKEND", "networkx")
+
+# Exponential decay of relationship weights (half-life 0 = off: weights are lifetime counts).
+# Edges that decayed below DECAY_MIN_WEIGHT are dropped every DECAY_COMPACT_INTERVAL of event time
+DECAY_HALF_LIFE = timedelta(hours=float(os.getenv("COLLUSION_DECAY_HALF_LIFE_HOURS", "0")))
+DECAY_RATE = math.log(2) / DECAY_HALF_LIFE.total_seconds() if DECAY_HALF_LIFE else 0.0
+DECAY_MIN_WEIGHT = float(os.getenv("COLLUSION_DECAY_MIN_WEIGHT", "0.05"))
+DECAY_COMPACT_INTERVAL = timedelta(hours=float(os.getenv("COLLUSION_DECAY_COMPACT_HOURS", "24")))
+
+# Transactions timestamped further than this ahead of the server clock are rejected (422)
+MAX_CLOCK_SKEW = timedelta(minutes=float(os.getenv("COLLUSION_MAX_CLOCK_SKEW_MINUTES", "60")))
+
+# With COLLUSION_SHARDS > 1 the graph is partitioned across that many worker processes
+SHARDS = int(os.getenv("COLLUSION_SHARDS", "0"))
+
+# Group commits: /detect commits at most every COMMIT_INTERVAL seconds (0 = after every event),
+# /detect/batch once per request and /detect/stream once per STREAM_BATCH_SIZE lines
+COMMIT_INTERVAL = float(os.getenv("COLLUSION_COMMIT_INTERVAL", "0"))
+STREAM_BATCH_SIZE = int(os.getenv("COLLUSION_STREAM_BATCH_SIZE", "500"))
+
+# The dashboard's relationship chart shows only the heaviest edges
+DASHBOARD_TOP_EDGES = int(os.getenv("COLLUSION_DASHBOARD_TOP_EDGES", "500"))
+
+DB_PATH = 'collusion.db'
+READ_POOL_SIZE = int(os.getenv("COLLUSION_READ_POOL_SIZE", "8"))  # idle read-only connections kept open
 
 # Database Setup
-conn = sqlite3.connect('collusion.db', check_same_thread=False)
+# `conn` is the only writer. After startup it is used solely from the `writer` executor thread;
+# API and dashboard reads go through `readers`, a pool of read-only WAL connections.
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 c = conn.cursor()
+# WAL lets readers run alongside the writer; with NORMAL sync a commit no longer waits on fsync
+c.execute('PRAGMA journal_mode=WAL')
+c.execute('PRAGMA synchronous=NORMAL')
 
 c.execute('''CREATE TABLE IF NOT EXISTS transactions
              (id TEXT PRIMARY KEY, employee_id TEXT, customer_id TEXT, 
@@ -23,97 +79,601 @@ c.execute('''CREATE TABLE IF NOT EXISTS transactions
 
 c.execute('''CREATE TABLE IF NOT EXISTS relationships
              (id TEXT PRIMARY KEY, employee_id TEXT, customer_id TEXT, 
-              strength REAL, last_updated TEXT)''')
+              strength REAL, last_updated TEXT, weight REAL)''')
+try:
+    # Relationships now store the raw edge weight; strength is normalized when read
+    c.execute('ALTER TABLE relationships ADD COLUMN weight REAL')
+except sqlite3.OperationalError:
+    # Column already exists
+    pass
+# Covering index for the startup GROUP BY over employee-customer pairs
+c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_pair ON transactions(employee_id, customer_id)')
+c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions(timestamp)')
+
+# Rings are materialized when detected, so reading recent ones is an indexed range query
+c.execute('''CREATE TABLE IF NOT EXISTS rings
+             (id TEXT PRIMARY KEY, detected_at TEXT, first_timestamp TEXT, last_timestamp TEXT,
+              hops INTEGER, members TEXT, transactions TEXT, total_amount REAL)''')
+c.execute('CREATE INDEX IF NOT EXISTS idx_rings_last_timestamp ON rings(last_timestamp)')
+c.execute('CREATE INDEX IF NOT EXISTS idx_relationships_weight ON relationships(weight)')
+c.execute('''CREATE TABLE IF NOT EXISTS ring_members
+             (member_id TEXT, ring_id TEXT, last_timestamp TEXT, PRIMARY KEY (member_id, last_timestamp, ring_id))''')
 conn.commit()
 
+class ReadOnlyPool:
+    """Read-only connections that readers borrow, so they never share cursor state with the writer"""
+    def __init__(self, path: str, size: int = READ_POOL_SIZE):
+        self.uri = f'file:{path}?mode=ro'
+        self.size = size
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        try:
+            reader = self.idle.get_nowait()
+        except queue.Empty:
+            reader = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        try:
+            yield reader
+        finally:
+            if self.idle.qsize() < self.size:
+                self.idle.put(reader)
+            else:
+                reader.close()
+
+readers = ReadOnlyPool(DB_PATH)
+
+# Single writer: detection mutates the graph and writes SQLite, so it runs on one thread off the event loop
+writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='collusion-writer')
+
+async def in_writer(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(writer, partial(fn, *args, **kwargs))
+
+def _epoch(timestamp: str) -> float:
+    """Epoch seconds of an ISO timestamp; raises ValueError if it cannot be parsed"""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except TypeError:
+        raise ValueError(f"invalid timestamp {timestamp!r}")
+
+def _stored_epoch(tx_id: str, timestamp: str):
+    """_epoch() for a stored row, or None (logged) for legacy rows saved before timestamps were validated"""
+    try:
+        return _epoch(timestamp)
+    except ValueError:
+        print(f"Skipping transaction {tx_id}: unparseable timestamp {timestamp!r}")
+        return None
+
+def _latest_epoch():
+    """Epoch of the latest stored transaction whose timestamp parses, or None"""
+    for tx_id, timestamp in conn.execute('SELECT id, timestamp FROM transactions ORDER BY timestamp DESC'):
+        ts = _stored_epoch(tx_id, timestamp)
+        if ts is not None:
+            return ts
+    return None
+
 # Detection Engine
 class CollusionDetector:
-    def __init__(self):
-        self.graph = nx.Graph()
+    def __init__(self, decay: float = DECAY_RATE):
+        self.graph = make_graph(GRAPH_BACKEND, decay)
+        self.last_commit = time.monotonic()
+        # Directed employee -> customer money flow for the ring search (see collusion_flows)
+        self.flows = FlowIndex(CYCLE_MAX_FANOUT)
+        self.flow_clock = FlowClock(CYCLE_WINDOW.total_seconds())
+        self.flow_seq = 0
+        # Number of edges at each weight, so the global maximum is kept in O(1) per update
+        self.weight_counts = Counter()
+        self.max_weight = 0
+        # With decay, the heaviest weight in the graph's reference frame; it only grows until compaction
+        self.max_frame_weight = 0.0
+        self.last_event_ts = None  # epoch of the latest transaction, for reading decayed weights
         self.load_existing_data()
     
-    def load_existing_data(self):
-        for row in c.execute('SELECT * FROM transactions'):
-            self._update_graph(row)
+    def load_existing_data(self, snapshot_path: str = SNAPSHOT_PATH):
+        """Rebuild the weighted graph from stored transactions.
+
+        Edge weights come from a single GROUP BY over employee-customer pairs, and
+        nothing is written while rebuilding. With a snapshot, only transactions
+        stored after it was taken are aggregated.
+        """
+        if self.graph.decay:
+            self._load_decayed_edges()
+            self._backfill_relationship_weights()
+            self._load_recent_flows()
+            return
+        
+        since_rowid = 0
+        if snapshot_path and os.path.exists(snapshot_path):
+            since_rowid = self._load_snapshot(snapshot_path)
+        
+        pairs = conn.execute('''SELECT employee_id, customer_id, COUNT(*) FROM transactions
+                                WHERE rowid > ? GROUP BY employee_id, customer_id''', (since_rowid,))
+        self._load_edges(pairs)
+        
+        self.weight_counts = Counter(w for _, _, w in self._edges())
+        self.max_weight = max(self.weight_counts, default=0)
+        self._backfill_relationship_weights()
+        self._load_recent_flows()
     
-    def process_transaction(self, tx_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        c.execute('''INSERT OR REPLACE INTO transactions VALUES 
-                     (?, ?, ?, ?, ?, ?, ?)''',
-                  (tx_data['transaction_id'], tx_data['employee_id'], 
-                   tx_data['customer_id'], tx_data['amount'], 
-                   tx_data['timestamp'], tx_data.get('risk_score', 0), 0))
+    def _load_decayed_edges(self):
+        """Replay only transactions whose weight has not decayed below DECAY_MIN_WEIGHT.
+
+        Snapshots are not used with decay: the replay is bounded by the decay
+        horizon instead of the table size.
+        """
+        latest = _latest_epoch()
+        if latest is None:
+            return
+        horizon = math.log(1 / DECAY_MIN_WEIGHT) / self.graph.decay
+        start = datetime.fromtimestamp(latest - horizon)
+        for tx_id, emp_id, cust_id, timestamp in conn.execute(
+                '''SELECT id, employee_id, customer_id, timestamp FROM transactions
+                   WHERE timestamp >= ? ORDER BY timestamp''', (start.isoformat(),)):
+            ts = _stored_epoch(tx_id, timestamp)
+            if ts is not None:
+                self.max_frame_weight = max(self.max_frame_weight, self.graph.add(emp_id, cust_id, ts=ts))
+        self.last_event_ts = latest
+        self.max_weight = self.max_frame_weight * self.graph.scale(self.last_event_ts)
+    
+    def _load_edges(self, edges):
+        """Add (employee_id, customer_id, weight) edges, summing weights of existing ones"""
+        self.graph.add_edges(edges)
+    
+    def _edges(self):
+        return self.graph.edges()
+    
+    def _load_recent_flows(self):
+        """Rebuild the ring-search flow index from transactions inside the cycle window"""
+        latest = _latest_epoch()
+        if latest is None:
+            return
+        start = datetime.fromtimestamp(latest) - CYCLE_WINDOW
+        for tx_id, emp_id, cust_id, amount, timestamp in conn.execute(
+                '''SELECT id, employee_id, customer_id, amount, timestamp FROM transactions
+                   WHERE timestamp >= ? ORDER BY timestamp''', (start.isoformat(),)):
+            ts = _stored_epoch(tx_id, timestamp)
+            if ts is not None:
+                self._record_flow(emp_id, cust_id, ts, tx_id, amount)
+    
+    def _load_snapshot(self, path: str) -> int:
+        """Load graph edges from a snapshot; returns the last transaction rowid it covers"""
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        
+        last_rowid = conn.execute('SELECT MAX(rowid) FROM transactions').fetchone()[0] or 0
+        if snapshot['rowid'] > last_rowid:
+            print(f"Ignoring snapshot {path}: it is newer than the transactions table")
+            return 0
+        
+        self._load_edges(snapshot['edges'])
+        return snapshot['rowid']
+    
+    def save_snapshot(self, path: str = SNAPSHOT_PATH):
+        """Write the graph edges and the last transaction rowid they cover"""
+        if not path or self.graph.decay:
+            return
+        last_rowid = conn.execute('SELECT MAX(rowid) FROM transactions').fetchone()[0] or 0
+        snapshot = {'rowid': last_rowid, 'edges': list(self._edges())}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    
+    def _backfill_relationship_weights(self):
+        """One-off fill of relationships rows written before the weight column existed"""
+        if conn.execute('SELECT 1 FROM relationships WHERE weight IS NULL LIMIT 1').fetchone() is None:
+            return
+        conn.execute('''INSERT OR REPLACE INTO relationships (id, employee_id, customer_id, weight, last_updated)
+                        SELECT employee_id || '-' || customer_id, employee_id, customer_id, COUNT(*), ?
+                        FROM transactions GROUP BY employee_id, customer_id''', (datetime.now().isoformat(),))
+        conn.commit()
+    
+    def process_transaction(self, tx_data: Dict[str, Any], commit: bool = True) -> List[Dict[str, Any]]:
+        previous = self._store_transaction(tx_data)
         
         tx = (tx_data['transaction_id'], tx_data['employee_id'], 
               tx_data['customer_id'], tx_data['amount'], tx_data['timestamp'])
         self._update_graph(tx)
+        seq = self._record_flow(tx_data['employee_id'], tx_data['customer_id'], _epoch(tx_data['timestamp']),
+                                tx_data['transaction_id'], tx_data['amount'])
         
-        alerts = self._run_detection(tx_data)
-        if alerts:
-            c.execute('UPDATE transactions SET is_collusion=1 WHERE id=?', 
-                      (tx_data['transaction_id'],))
+        alerts = self._run_detection(tx_data, seq)
+        self._store_alerts(tx_data, alerts)
+        dashboard.record(tx_data, alerts, previous)
+        self._evict_flows_if_due()
         
-        conn.commit()
+        if commit:
+            self.commit()
         return alerts
+
+    def _store_transaction(self, tx_data: Dict[str, Any]):
+        """Insert or replace the transaction row; returns the replaced row's is_collusion, or None if it is new"""
+        previous = conn.execute('SELECT is_collusion FROM transactions WHERE id=?',
+                                (tx_data['transaction_id'],)).fetchone()
+        conn.execute('''INSERT OR REPLACE INTO transactions VALUES 
+                     (?, ?, ?, ?, ?, ?, ?)''',
+                  (tx_data['transaction_id'], tx_data['employee_id'], 
+                   tx_data['customer_id'], tx_data['amount'], 
+                   tx_data['timestamp'], tx_data.get('risk_score', 0), 0))
+        return previous[0] if previous else None
+
+    def _store_alerts(self, tx_data: Dict[str, Any], alerts: List[Dict[str, Any]]):
+        if alerts:
+            conn.execute('UPDATE transactions SET is_collusion=1 WHERE id=?', 
+                      (tx_data['transaction_id'],))
+            for alert in alerts:
+                if alert['rule'] == 'CIRCULAR_TRANSACTIONS':
+                    self._save_ring(tx_data['transaction_id'], alert)
+
+    def process_batch(self, batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Run detection on each transaction in order and commit all writes once"""
+        try:
+            return [self.process_transaction(tx_data, commit=False) for tx_data in batch]
+        finally:
+            self.commit()
+
+    def commit(self):
+        if conn.in_transaction:
+            conn.commit()
+        self.last_commit = time.monotonic()
+
+    def commit_if_due(self, interval: float = COMMIT_INTERVAL):
+        """Commit pending writes once `interval` seconds have passed since the last commit"""
+        if time.monotonic() - self.last_commit >= interval:
+            self.commit()
+
+    def close(self):
+        """Release background resources; the single-process detector has none"""
     
     def _update_graph(self, tx: tuple):
         emp_id, cust_id = tx[1], tx[2]
         
-        if self.graph.has_edge(emp_id, cust_id):
-            self.graph[emp_id][cust_id]['weight'] += 1
+        if self.graph.decay:
+            ts = self.last_event_ts = _epoch(tx[4])
+            self._compact_if_due(ts)
+            frame_weight = self.graph.add(emp_id, cust_id, ts=ts)
+            self.max_frame_weight = max(self.max_frame_weight, frame_weight)
+            scale = self.graph.scale(ts)
+            weight = frame_weight * scale
+            self.max_weight = self.max_frame_weight * scale
         else:
-            self.graph.add_edge(emp_id, cust_id, weight=1)
-        
-        max_weight = max((d['weight'] for _, _, d in self.graph.edges(data=True)), default=1)
-        strength = self.graph[emp_id][cust_id]['weight'] / max_weight
-        
-        c.execute('''INSERT OR REPLACE INTO relationships VALUES 
-                     (?, ?, ?, ?, ?)''',
+            weight = self.graph.add(emp_id, cust_id)
+            old_weight = weight - 1
+            self._track_weight(old_weight, weight)
+        self._store_relationship(emp_id, cust_id, weight)
+    
+    def _compact_if_due(self, ts: float):
+        """Drop edges that decayed below DECAY_MIN_WEIGHT once per DECAY_COMPACT_INTERVAL"""
+        if self.graph.t0 is None or ts - self.graph.t0 < DECAY_COMPACT_INTERVAL.total_seconds():
+            return
+        dropped = self.graph.compact(ts, DECAY_MIN_WEIGHT)
+        self.max_frame_weight = max((w for _, _, w in self.graph.edges()), default=0.0)
+        # Edges are undirected in the graph, so remove the row under either orientation
+        conn.executemany('DELETE FROM relationships WHERE id IN (?, ?)',
+                         [(f"{a}-{b}", f"{b}-{a}") for a, b in dropped])
+        print(f"Compacted relationship graph: dropped {len(dropped)} decayed edges, "
+              f"{self.graph.number_of_edges()} remain")
+    
+    def _store_relationship(self, emp_id: str, cust_id: str, weight: float):
+        conn.execute('''INSERT OR REPLACE INTO relationships (id, employee_id, customer_id, weight, last_updated)
+                     VALUES (?, ?, ?, ?, ?)''',
                   (f"{emp_id}-{cust_id}", emp_id, cust_id, 
-                   strength, datetime.now().isoformat()))
+                   weight, datetime.now().isoformat()))
+    
+    def _track_weight(self, old_weight: float, new_weight: float):
+        """Move one edge between weight buckets and keep max_weight current"""
+        if old_weight:
+            self.weight_counts[old_weight] -= 1
+            if not self.weight_counts[old_weight]:
+                del self.weight_counts[old_weight]
+        if new_weight:
+            self.weight_counts[new_weight] += 1
+        
+        if new_weight > self.max_weight:
+            self.max_weight = new_weight
+        elif old_weight == self.max_weight and old_weight not in self.weight_counts:
+            # Only reachable when the heaviest edge shrinks or is removed
+            self.max_weight = max(self.weight_counts, default=0)
+    
+    def _record_flow(self, src: str, dst: str, ts: float, tx_id: str, amount: float):
+        """Add a flow to the ring-search index; returns its ingest seq, or None if it is too late to search"""
+        self.flow_seq += 1
+        searchable = self.flow_clock.observe(ts)
+        self.flows.record(src, dst, ts, self.flow_seq, tx_id, amount)
+        return self.flow_seq if searchable else None
+    
+    def _evict_flows_if_due(self):
+        """Drop flows that no later search can use, so the index only spans the cycle window"""
+        cutoff = self.flow_clock.sweep_cutoff()
+        if cutoff is not None:
+            self.flows.evict(cutoff)
+    
+    def find_ring(self, src: str, dst: str, ts: float, seq: float = math.inf):
+        """Find a time-ordered ring closed by the flow src -> dst at time ts.
+
+        Searches backwards from src for a path dst -> ... -> src whose hops
+        happen in time order, after ts - CYCLE_WINDOW and no later than ts,
+        ignoring flows ingested at or after `seq`. The shortest ring wins; see
+        collusion_flows.find_rings for the fanout and frontier limits.
+        Returns the ring as a list of (src, dst, event) hops in flow order, or None.
+        """
+        return find_rings([(0, src, dst, ts, seq)], self.flows.expand, CYCLE_MIN_HOPS, CYCLE_MAX_HOPS,
+                          CYCLE_WINDOW.total_seconds(), CYCLE_MAX_FRONTIER).get(0)
+    
+    def get_relationships(self, limit: int = -1) -> pd.DataFrame:
+        """Relationships with strength normalized against the current heaviest edge, heaviest first"""
+        with readers.connection() as reader:
+            return pd.read_sql('''SELECT id, employee_id, customer_id, weight,
+                                      MIN(1.0, weight * 1.0 / ?) AS strength, last_updated
+                               FROM relationships ORDER BY weight DESC LIMIT ?''', reader,
+                               params=(max(self.max_weight, 1), limit))
     
-    def _run_detection(self, tx_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _run_detection(self, tx_data: Dict[str, Any], seq: int = None) -> List[Dict[str, Any]]:
         emp_id, cust_id = tx_data['employee_id'], tx_data['customer_id']
         alerts = []
         
         # Relationship strength detection
-        neighbors = list(self.graph.neighbors(emp_id))
-        if neighbors:
-            this_strength = self.graph[emp_id][cust_id]['weight']
-            avg_strength = sum(self.graph[emp_id][n]['weight'] for n in neighbors) / len(neighbors)
-            if this_strength > 3 * avg_strength:
-                alerts.append({
-                    'rule': 'UNUSUAL_RELATIONSHIP_STRENGTH',
-                    'confidence': min(0.99, this_strength / (avg_strength + 1))
-                })
+        # Running aggregates make this O(1) however many customers the employee has
+        total, degree, _ = self.graph.aggregates(emp_id)
+        if degree:
+            # Stored weights share one decay frame; scale them to weights as of this transaction
+            scale = self.graph.scale(_epoch(tx_data['timestamp']))
+            this_strength = self.graph.weight(emp_id, cust_id) * scale
+            avg_strength = total / degree * scale
+            alerts.append(self._strength_alert(this_strength, avg_strength))
         
-        # Circular transactions detection
-        try:
-            if len(nx.find_cycle(self.graph, cust_id)) >= 3:
-                alerts.append({'rule': 'CIRCULAR_TRANSACTIONS', 'confidence': 0.85})
-        except nx.NetworkXNoCycle:
-            pass
+        # Circular transactions detection: does this flow close a recent money ring?
+        # Flows arriving more than a window behind the newest one are not searched (seq is None)
+        if seq is not None:
+            alerts.append(self._ring_alert(tx_data, self.find_ring(emp_id, cust_id, _epoch(tx_data['timestamp']), seq)))
+        
+        return [alert for alert in alerts if alert]
+
+    def employee_aggregates(self, emp_id: str):
+        """Running totals over an employee's relationships, or None if the employee is unknown"""
+        total, degree, heaviest = self._aggregates(emp_id)
+        if not degree:
+            return None
+        scale = self.graph.scale(self.last_event_ts) if self.last_event_ts is not None else 1.0
+        return {
+            'employee_id': emp_id,
+            'relationships': degree,
+            'total_weight': total * scale,
+            'average_weight': total / degree * scale,
+            'max_weight': heaviest * scale
+        }
+
+    def _aggregates(self, emp_id: str):
+        return self.graph.aggregates(emp_id)
+
+    def _strength_alert(self, this_strength: float, avg_strength: float):
+        if this_strength > 3 * avg_strength:
+            return {
+                'rule': 'UNUSUAL_RELATIONSHIP_STRENGTH',
+                'confidence': min(0.99, this_strength / (avg_strength + 1))
+            }
+        return None
+
+    def _ring_alert(self, tx_data: Dict[str, Any], ring):
+        if not ring:
+            return None
+        emp_id, cust_id = tx_data['employee_id'], tx_data['customer_id']
+        hops = ring + [(emp_id, cust_id, (_epoch(tx_data['timestamp']), tx_data['transaction_id'], tx_data['amount']))]
+        return {
+            'rule': 'CIRCULAR_TRANSACTIONS',
+            'confidence': 0.85,
+            'members': [src for src, _, _ in hops],
+            'transactions': [{'transaction_id': event[1], 'from': src, 'to': dst, 'amount': event[2],
+                              'timestamp': datetime.fromtimestamp(event[0]).isoformat()}
+                             for src, dst, event in hops]
+        }
+
+    def _save_ring(self, ring_id: str, alert: Dict[str, Any]):
+        """Persist a detected ring, keyed by the transaction that closed it"""
+        hops = alert['transactions']
+        conn.execute('''INSERT OR REPLACE INTO rings VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (ring_id, datetime.now().isoformat(), hops[0]['timestamp'], hops[-1]['timestamp'],
+                   len(hops), json.dumps(alert['members']), json.dumps(hops),
+                   sum(hop['amount'] for hop in hops)))
+        conn.executemany('INSERT OR REPLACE INTO ring_members VALUES (?, ?, ?)',
+                         [(member, ring_id, hops[-1]['timestamp']) for member in alert['members']])
+    
+    def get_recent_rings(self, limit: int = 5, since: str = None, member: str = None) -> List[Dict[str, Any]]:
+        """Most recent rings, newest first, optionally since a timestamp or involving one member"""
+        if member is not None:
+            query = '''SELECT r.* FROM ring_members m JOIN rings r ON r.id = m.ring_id
+                       WHERE m.member_id = ? AND m.last_timestamp >= ?
+                       ORDER BY m.last_timestamp DESC LIMIT ?'''
+            params = (member, since or '', limit)
+        else:
+            query = '''SELECT * FROM rings WHERE last_timestamp >= ?
+                       ORDER BY last_timestamp DESC LIMIT ?'''
+            params = (since or '', limit)
+        
+        with readers.connection() as reader:
+            rows = reader.execute(query, params).fetchall()
         
+        rings = []
+        for row in rows:
+            ring_id, detected_at, first_ts, last_ts, hops, members, transactions, total = row
+            rings.append({
+                'ring_id': ring_id, 'detected_at': detected_at,
+                'first_timestamp': first_ts, 'last_timestamp': last_ts,
+                'hops': hops, 'members': json.loads(members),
+                'transactions': json.loads(transactions), 'total_amount': total
+            })
+        return rings
+    
+    def get_circular_transactions(self) -> List[Dict[str, Any]]:
+        return self.get_recent_rings(limit=5)
+
+class ShardedCollusionDetector(CollusionDetector):
+    """CollusionDetector whose graph is partitioned across worker processes.
+
+    Graph updates and ring searches run in the shards (see collusion_shards);
+    this process keeps the SQLite writes and the weight buckets. Transactions
+    are handed to the shards a batch at a time, so /detect/batch and
+    /detect/stream are what spread ingest across cores.
+    """
+    def __init__(self, shards: int = SHARDS):
+        self.pool = ShardPool(shards, CYCLE_MIN_HOPS, CYCLE_MAX_HOPS, CYCLE_WINDOW.total_seconds(),
+                              CYCLE_MAX_FANOUT, CYCLE_MAX_FRONTIER)
+        if DECAY_RATE:
+            print("COLLUSION_DECAY_HALF_LIFE_HOURS is not supported with COLLUSION_SHARDS; using lifetime weights")
+        super().__init__(decay=0.0)
+    
+    def _load_edges(self, edges):
+        for emp_id, cust_id, count in edges:
+            self.pool.load_edge(emp_id, cust_id, count)
+        self.pool.flush()
+    
+    def _edges(self):
+        return self.pool.edges()
+    
+    def _aggregates(self, emp_id: str):
+        return self.pool.aggregates(emp_id)
+    
+    def _load_recent_flows(self):
+        super()._load_recent_flows()
+        self.pool.flush()
+    
+    def _record_flow(self, src: str, dst: str, ts: float, tx_id: str, amount: float):
+        # Queued until the next flush; only used while loading
+        self.pool.record_flow(src, dst, ts, tx_id, amount)
+    
+    def process_transaction(self, tx_data: Dict[str, Any], commit: bool = True) -> List[Dict[str, Any]]:
+        alerts = self._process_sharded([tx_data])[0]
+        if commit:
+            self.commit()
         return alerts
+    
+    def process_batch(self, batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        try:
+            return self._process_sharded(batch)
+        finally:
+            self.commit()
+    
+    def _process_sharded(self, batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        results = self.pool.apply([(tx['employee_id'], tx['customer_id'], _epoch(tx['timestamp']),
+                                    tx['transaction_id'], tx['amount']) for tx in batch])
+        batch_alerts = []
+        for tx_data, (weight, avg_strength, ring) in zip(batch, results):
+            previous = self._store_transaction(tx_data)
+            self._track_weight(weight - 1, weight)
+            self._store_relationship(tx_data['employee_id'], tx_data['customer_id'], weight)
+            
+            alerts = [alert for alert in (self._strength_alert(weight, avg_strength),
+                                          self._ring_alert(tx_data, ring)) if alert]
+            self._store_alerts(tx_data, alerts)
+            dashboard.record(tx_data, alerts, previous)
+            batch_alerts.append(alerts)
+        return batch_alerts
+    
+    def close(self):
+        self.pool.close()
 
-    def get_circular_transactions(self) -> pd.DataFrame:
-        query = '''
-            SELECT t1.id as tx1, t2.id as tx2, t3.id as tx3,
-                   t1.employee_id as emp1, t2.employee_id as emp2,
-                   t1.customer_id as cust1, t2.customer_id as cust2, t3.customer_id as cust3,
-                   t1.timestamp as time1, t2.timestamp as time2, t3.timestamp as time3,
-                   t1.amount as amt1, t2.amount as amt2, t3.amount as amt3
-            FROM transactions t1
-            JOIN transactions t2 ON t1.customer_id = t2.employee_id
-            JOIN transactions t3 ON t2.customer_id = t3.employee_id AND t3.customer_id = t1.employee_id
-            WHERE t1.is_collusion = 1 AND t2.is_collusion = 1 AND t3.is_collusion = 1
-            ORDER BY t1.timestamp DESC
-            LIMIT 5
-        '''
-        return pd.read_sql(query, conn)
+class DashboardSnapshot:
+    """What the dashboard shows, kept current by the detector as transactions are processed.
+
+    Counters start from one COUNT(*) at startup and are then incremented, and
+    recent transactions, alerts and rings are kept in short in-memory lists, so
+    a refresh never scans the tables. `version` changes whenever anything does.
+    """
+    def __init__(self, recent: int = 50, alerts: int = 10, rings: int = 5):
+        self.lock = Lock()
+        self.version = 0
+        self.tx_count = 0
+        self.alert_count = 0
+        self.transactions = deque(maxlen=recent)  # newest first
+        self.alerts = deque(maxlen=alerts)
+        self.rings = deque(maxlen=rings)
+    
+    def load(self, rings: List[Dict[str, Any]]):
+        with readers.connection() as reader:
+            self.tx_count = reader.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+            self.alert_count = reader.execute('SELECT COUNT(*) FROM transactions WHERE is_collusion=1').fetchone()[0]
+            columns = 'id, employee_id, customer_id, amount, timestamp, is_collusion'
+            self.transactions.extend(self._rows(reader.execute(
+                f'SELECT {columns} FROM transactions ORDER BY timestamp DESC LIMIT ?', (self.transactions.maxlen,))))
+            self.alerts.extend(self._rows(reader.execute(
+                f'SELECT {columns} FROM transactions WHERE is_collusion=1 ORDER BY timestamp DESC LIMIT ?',
+                (self.alerts.maxlen,))))
+        self.rings.extend(rings)
+        self.version += 1
+    
+    @staticmethod
+    def _rows(cursor):
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+    
+    def record(self, tx_data: Dict[str, Any], alerts: List[Dict[str, Any]], previous: int = None):
+        """Add a processed transaction; `previous` is the is_collusion of the row it replaced, None if new"""
+        tx = {'id': tx_data['transaction_id'], 'employee_id': tx_data['employee_id'],
+              'customer_id': tx_data['customer_id'], 'amount': tx_data['amount'],
+              'timestamp': tx_data['timestamp'], 'is_collusion': int(bool(alerts))}
+        with self.lock:
+            if previous is None:
+                self.tx_count += 1
+            else:
+                # A resubmitted ID replaces its row, so it replaces its list entries too
+                self._discard(self.transactions, tx['id'])
+                self._discard(self.alerts, tx['id'])
+            self.alert_count += tx['is_collusion'] - (previous or 0)
+            self.transactions.appendleft(tx)
+            if alerts:
+                self.alerts.appendleft(tx)
+                for alert in alerts:
+                    if alert['rule'] == 'CIRCULAR_TRANSACTIONS':
+                        self.rings.appendleft({'ring_id': tx['id'], 'transactions': alert['transactions']})
+            self.version += 1
+    
+    @staticmethod
+    def _discard(rows: deque, tx_id: str):
+        for row in [row for row in rows if row['id'] == tx_id]:
+            rows.remove(row)
+    
+    def state(self) -> Dict[str, Any]:
+        """Consistent copy of the snapshot"""
+        with self.lock:
+            return {
+                'version': self.version, 'tx_count': self.tx_count, 'alert_count': self.alert_count,
+                'transactions': list(self.transactions), 'alerts': list(self.alerts), 'rings': list(self.rings)
+            }
 
 # Web API
 app = FastAPI()
-detector = CollusionDetector()
+detector = ShardedCollusionDetector(SHARDS) if SHARDS > 1 else CollusionDetector()
+dashboard = DashboardSnapshot()
+dashboard.load(detector.get_recent_rings(limit=5))
+
+@app.get("/rings")
+def recent_rings(limit: int = 20, since: str = None, member: str = None):
+    return {"rings": detector.get_recent_rings(limit=min(limit, 500), since=since, member=member)}
+
+@app.get("/employees/{emp_id}/aggregates")
+async def employee_aggregates(emp_id: str):
+    aggregates = await in_writer(detector.employee_aggregates, emp_id)
+    if aggregates is None:
+        raise HTTPException(status_code=404, detail=f"No relationships recorded for {emp_id}")
+    return aggregates
+
+@app.on_event("startup")
+async def start_group_committer():
+    if COMMIT_INTERVAL > 0:
+        asyncio.get_running_loop().create_task(flush_writes())
+
+async def flush_writes():
+    # Commits writes left open by /detect when no further event arrives within the window
+    while True:
+        await asyncio.sleep(COMMIT_INTERVAL)
+        await in_writer(detector.commit_if_due)
+
+@app.on_event("shutdown")
+def save_graph_snapshot():
+    writer.submit(detector.commit)
+    writer.submit(detector.save_snapshot)
+    writer.submit(detector.close)
+    writer.shutdown(wait=True)
 
 class TransactionInput(BaseModel):
     transaction_id: str
@@ -123,15 +683,77 @@ class TransactionInput(BaseModel):
     timestamp: str
     risk_score: float = 0.0
 
-@app.post("/detect")
-async def detect_collusion(tx: TransactionInput):
-    alerts = detector.process_transaction(tx.dict())
+    @field_validator('timestamp')
+    @classmethod
+    def check_timestamp(cls, value: str) -> str:
+        # Event time drives decay, compaction and the ring window, so it must parse and not run ahead
+        if _epoch(value) > time.time() + MAX_CLOCK_SKEW.total_seconds():
+            raise ValueError(f"timestamp {value} is more than {MAX_CLOCK_SKEW} in the future")
+        return value
+
+def detection_result(transaction_id: str, alerts: List[Dict[str, Any]]) -> Dict[str, Any]:
     return {
-        "transaction_id": tx.transaction_id,
+        "transaction_id": transaction_id,
         "alerts": alerts,
         "status": "flagged" if alerts else "clean"
     }
 
+@app.post("/detect")
+async def detect_collusion(tx: TransactionInput):
+    alerts = await in_writer(detector.process_transaction, tx.dict(), commit=COMMIT_INTERVAL <= 0)
+    if COMMIT_INTERVAL > 0:
+        await in_writer(detector.commit_if_due)
+    return detection_result(tx.transaction_id, alerts)
+
+@app.post("/detect/batch")
+async def detect_collusion_batch(txs: List[TransactionInput]):
+    """Detect over a JSON array of transactions; results come back in input order"""
+    alerts = await in_writer(detector.process_batch, [tx.dict() for tx in txs])
+    return {"results": [detection_result(tx.transaction_id, tx_alerts) for tx, tx_alerts in zip(txs, alerts)]}
+
+@app.post("/detect/stream")
+async def detect_collusion_stream(request: Request):
+    """Detect over an NDJSON body (one transaction per line), committing every STREAM_BATCH_SIZE lines.
+
+    Answers with one NDJSON result line per input line, in input order.
+    Lines that fail validation get an "invalid" result and are skipped.
+    """
+    results = []
+    pending = []  # (line number, TransactionInput or error) waiting for the next group commit
+
+    async def flush():
+        valid = [item for _, item in pending if isinstance(item, TransactionInput)]
+        alerts = iter(await in_writer(detector.process_batch, [tx.dict() for tx in valid]))
+        for line_no, item in pending:
+            if isinstance(item, TransactionInput):
+                results.append(json.dumps(detection_result(item.transaction_id, next(alerts))))
+            else:
+                results.append(json.dumps({"line": line_no, "status": "invalid", "error": item}))
+        pending.clear()
+
+    async def add_line(line_no: int, line: bytes):
+        if not line.strip():
+            return
+        try:
+            pending.append((line_no, TransactionInput(**json.loads(line))))
+        except (ValueError, TypeError) as e:
+            pending.append((line_no, str(e)))
+        if len(pending) >= STREAM_BATCH_SIZE:
+            await flush()
+
+    buffer = b""
+    line_no = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            await add_line(line_no, line)
+    await add_line(line_no + 1, buffer)
+    await flush()
+
+    return Response("".join(result + "\n" for result in results), media_type="application/x-ndjson")
+
 # Minimalist Dashboard
 def run_dashboard():
     dash_app = dash.Dash(__name__, assets_folder='assets')
@@ -248,9 +870,15 @@ def run_dashboard():
             ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%', 'verticalAlign': 'top'})
         ]),
         
-        dcc.Interval(id='interval-component', interval=2000, n_intervals=0)
+        dcc.Interval(id='interval-component', interval=2000, n_intervals=0),
+        # Snapshot version this browser tab last rendered
+        dcc.Store(id='dashboard-version')
     ])
 
+    # Outputs are rendered once per snapshot version and shared by every open tab
+    render_lock = Lock()
+    rendered = {'version': None, 'outputs': None}
+
     @dash_app.callback(
         [Output('relationship-graph', 'figure'),
          Output('transaction-stream', 'children'),
@@ -258,15 +886,29 @@ def run_dashboard():
          Output('transaction-count', 'children'),
          Output('alert-count', 'children'),
          Output('last-alert', 'children'),
-         Output('circular-transactions-graph', 'figure')],
-        [Input('interval-component', 'n_intervals')]
+         Output('circular-transactions-graph', 'figure'),
+         Output('dashboard-version', 'data')],
+        [Input('interval-component', 'n_intervals')],
+        [State('dashboard-version', 'data')]
     )
-    def update_dashboard(n):
+    def update_dashboard(n, tab_version):
+        if dashboard.version == tab_version:
+            return (dash.no_update,) * 8
+        with render_lock:
+            if rendered['version'] != dashboard.version:
+                state = dashboard.state()
+                rendered['outputs'] = render_dashboard(state)
+                rendered['version'] = state['version']
+            return rendered['outputs'] + (rendered['version'],)
+
+    def render_dashboard(state):
         # Get data
-        relationships = pd.read_sql('SELECT * FROM relationships', conn)
-        transactions = pd.read_sql('SELECT * FROM transactions ORDER BY timestamp DESC LIMIT 50', conn)
-        alerts = pd.read_sql('SELECT * FROM transactions WHERE is_collusion=1 ORDER BY timestamp DESC LIMIT 10', conn)
-        circular_tx = detector.get_circular_transactions()
+        relationships = detector.get_relationships(limit=DASHBOARD_TOP_EDGES)
+        transactions = state['transactions']
+        alerts = state['alerts']
+        tx_count = state['tx_count']
+        alert_count = state['alert_count']
+        circular_tx = state['rings']
 
         # 1. Relationship Graph
         rel_fig = px.scatter(
@@ -294,7 +936,7 @@ def run_dashboard():
                 html.Span(f"{tx['employee_id']} → {tx['customer_id']}")
             ], style={**styles['streamItem'], 
                       'color': '#e74c3c' if tx['is_collusion'] else '#2c3e50'})
-            for _, tx in transactions.iterrows()
+            for tx in transactions
         ]
 
         # 3. Alerts Table
@@ -303,15 +945,15 @@ def run_dashboard():
             'transaction_id': alert['id'][:8] + "...",
             'amount': f"${alert['amount']:,.2f}",
             'parties': f"{alert['employee_id']} ↔ {alert['customer_id']}"
-        } for _, alert in alerts.iterrows()]
+        } for alert in alerts]
 
         # 4. Circular Transactions Graph
-        if not circular_tx.empty:
+        if circular_tx:
             circ_fig = go.Figure()
-            for _, circ in circular_tx.iterrows():
+            for circ in circular_tx:
                 circ_fig.add_trace(go.Scatter(
-                    x=[circ['time1'], circ['time2'], circ['time3']],
-                    y=[circ['amt1'], circ['amt2'], circ['amt3']],
+                    x=[hop['timestamp'] for hop in circ['transactions']],
+                    y=[hop['amount'] for hop in circ['transactions']],
                     mode='lines+markers',
                     line=dict(color='#e74c3c', width=2),
                     marker=dict(size=8)
@@ -336,9 +978,7 @@ def run_dashboard():
             )
 
         # Metrics
-        tx_count = c.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
-        alert_count = c.execute('SELECT COUNT(*) FROM transactions WHERE is_collusion=1').fetchone()[0]
-        last_alert = alerts.iloc[0]['timestamp'][11:19] if not alerts.empty else "None"
+        last_alert = alerts[0]['timestamp'][11:19] if alerts else "None"
 
         return (
             rel_fig,
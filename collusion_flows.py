@@ -0,0 +1,150 @@
+# collusion_flows.py
+import heapq
+import math
+from bisect import bisect_right, insort
+
+
+class FlowIndex:
+    """Recent directed money flows, indexed by destination for the backward ring search.
+
+    A flow src -> dst is stored under dst as (epoch, seq, transaction_id,
+    amount) events in time order; `seq` is the ingest order, so a search for
+    one transaction can ignore flows that arrived after it. `evict()` drops
+    events older than a cutoff, and edges left without events, so memory
+    follows the cycle window rather than the whole history.
+    """
+
+    def __init__(self, max_fanout):
+        self.max_fanout = max_fanout
+        self.pred = {}  # dst -> {src: [events]}
+
+    def record(self, src, dst, ts, seq, tx_id, amount):
+        insort(self.pred.setdefault(dst, {}).setdefault(src, []), (ts, seq, tx_id, amount))
+
+    def expand(self, requests):
+        """Predecessors of each frontier node with their latest usable event.
+
+        Each request is (node, before, window_start, seq_limit); the answer for
+        it is a list of (pred, (epoch, transaction_id, amount)), most recent
+        first with ties in node order, capped at max_fanout.
+        """
+        answers = []
+        for node, before, window_start, seq_limit in requests:
+            found = []
+            for pred, events in self.pred.get(node, {}).items():
+                i = bisect_right(events, (before, math.inf))
+                while i and events[i - 1][1] >= seq_limit:
+                    i -= 1
+                if i and events[i - 1][0] >= window_start:
+                    ts, _, tx_id, amount = events[i - 1]
+                    found.append((pred, (ts, tx_id, amount)))
+            answers.append(heapq.nsmallest(self.max_fanout, found, key=lambda item: (-item[1][0], item[0])))
+        return answers
+
+    def evict(self, cutoff):
+        """Drop events before `cutoff` and the edges and nodes left empty; returns the edges dropped"""
+        dropped = 0
+        for dst in list(self.pred):
+            preds = self.pred[dst]
+            for src in list(preds):
+                events = preds[src]
+                del events[:bisect_right(events, (cutoff,))]
+                if not events:
+                    del preds[src]
+                    dropped += 1
+            if not preds:
+                del self.pred[dst]
+        return dropped
+
+    def number_of_edges(self):
+        return sum(len(preds) for preds in self.pred.values())
+
+
+class FlowClock:
+    """Event-time bookkeeping shared by the single-process and sharded detectors.
+
+    A flow more than one window behind the newest flow seen before it is
+    recorded but not searched. Eviction runs after searches with a cutoff two
+    windows behind the newest flow, so it never removes an event a later
+    search could still use, and both detectors find the same rings however
+    transactions are batched.
+    """
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.latest = None
+        self.last_sweep = None
+
+    def observe(self, ts):
+        """Record a flow's time; returns whether a ring search should run for it"""
+        searchable = self.latest is None or ts >= self.latest - self.window_seconds
+        if self.latest is None or ts > self.latest:
+            self.latest = ts
+        return searchable
+
+    def sweep_cutoff(self):
+        """Eviction cutoff if a sweep is due (every quarter window of event time), else None"""
+        if self.latest is None:
+            return None
+        if self.last_sweep is not None and self.latest - self.last_sweep < self.window_seconds / 4:
+            return None
+        self.last_sweep = self.latest
+        return self.latest - 2 * self.window_seconds
+
+
+def find_rings(searches, expand, min_hops, max_hops, window_seconds, max_frontier):
+    """Level-synchronous backward search for rings closed by new flows.
+
+    `searches` holds (key, src, dst, epoch, seq) for flows src -> dst; a ring
+    is a time-ordered path dst -> ... -> src of min_hops-1 to max_hops-1
+    earlier flows inside the window. All searches advance one hop per call to
+    `expand` (see FlowIndex.expand). The shortest ring wins, ties broken by
+    member order. Each node is kept once per depth, through its latest flow
+    (which leaves the most room upstream), and at most max_frontier open
+    paths per depth, which bounds the work on dense graphs.
+
+    Returns {key: ring}, the ring being a list of (src, dst, (epoch,
+    transaction_id, amount)) hops in flow order.
+    """
+    min_depth, max_depth = min_hops - 1, max_hops - 1
+    found = {}
+    # Frontier entries: (key, node, nodes on the path, hops so far walking backwards, before)
+    frontier = [(key, src, (src,), (), ts) for key, src, dst, ts, _ in searches if src != dst]
+    limits = {key: (dst, ts - window_seconds, seq) for key, _, dst, ts, seq in searches}
+
+    for _ in range(max_depth):
+        if not frontier:
+            break
+        answers = expand([(node, before, limits[key][1], limits[key][2])
+                          for key, node, _, _, before in frontier])
+        closed = {}
+        extended = []
+        for (key, node, path, hops, _), candidates in zip(frontier, answers):
+            dst = limits[key][0]
+            for pred, event in candidates:
+                if pred == dst:
+                    if len(hops) + 1 >= min_depth:
+                        ring = list(reversed(hops + ((pred, node, event),)))
+                        members = tuple(hop[0] for hop in ring)
+                        if key not in closed or members < closed[key][0]:
+                            closed[key] = (members, ring)
+                    continue
+                if pred not in path and len(hops) + 1 < max_depth:
+                    extended.append((key, pred, path + (pred,), hops + ((pred, node, event),), event[0]))
+
+        # Newest first (stable, so ties keep expansion order), then one path per (key, node)
+        extended.sort(key=lambda entry: -entry[4])
+        next_frontier = []
+        seen = set()
+        sizes = {}
+        for entry in extended:
+            key, pred = entry[0], entry[1]
+            if (key, pred) in seen or sizes.get(key, 0) >= max_frontier:
+                continue
+            seen.add((key, pred))
+            sizes[key] = sizes.get(key, 0) + 1
+            next_frontier.append(entry)
+        for key, (_, ring) in closed.items():
+            found[key] = ring
+        frontier = [entry for entry in next_frontier if entry[0] not in found]
+    return found
@@ -0,0 +1,414 @@
+# collusion_graph.py
+import math
+
+import networkx as nx
+import numpy as np
+
+# Edges are keyed by both interned endpoints packed into one int, smaller id first
+KEY_SHIFT = 32
+
+# New ArrayGraph edges are looked up in a dict until this many (or 1/32 of all edges)
+# have accumulated, then merged into the sorted key array
+DELTA_EDGES = 4096
+
+# Recently looked-up node names kept in a plain dict in front of the NodeTable hash table
+RECENT_NODES = 4096
+
+# Bound on decay exponents: exp(700) is still a finite float
+MAX_EXPONENT = 700.0
+
+
+class DecayFrame:
+    """Lazy exponential decay shared by the graph backends.
+
+    With a decay rate, weights are stored in the reference frame of time t0:
+    an increment at time t is added as exp(decay * (t - t0)), so untouched
+    edges need no updates and stored weights only grow. The actual weight at
+    time t is the stored one times `scale(t)`. `compact()` rebases the frame
+    to the current time, which also keeps the stored values from overflowing.
+    Exponents are clamped to +-MAX_EXPONENT, so an outlying timestamp skews
+    weights instead of raising OverflowError.
+    """
+
+    def __init__(self, decay=0.0):
+        self.decay = decay  # per second; 0 keeps plain counts
+        self.t0 = None
+
+    def _frame_weight(self, weight, ts):
+        if not self.decay:
+            return weight
+        if self.t0 is None:
+            self.t0 = ts
+        return weight * math.exp(self._exponent(ts))
+
+    def scale(self, ts):
+        """Factor turning stored weights into actual weights at time ts"""
+        if not self.decay or self.t0 is None:
+            return 1.0
+        return math.exp(-self._exponent(ts))
+
+    def _exponent(self, ts):
+        return min(max(self.decay * (ts - self.t0), -MAX_EXPONENT), MAX_EXPONENT)
+
+
+class NetworkXGraph(DecayFrame):
+    """Weighted employee-customer graph on a NetworkX Graph (the original representation)"""
+
+    def __init__(self, decay=0.0):
+        super().__init__(decay)
+        self.graph = nx.Graph()
+        # Per-node total and heaviest edge weight, kept current on every add
+        self.totals = {}
+        self.maxima = {}
+
+    def add_edges(self, edges):
+        """Add (node, node, weight) edges, summing weights of existing ones"""
+        if self.graph.number_of_edges() == 0:
+            self.graph.add_weighted_edges_from(edges)
+        else:
+            for a, b, weight in edges:
+                if self.graph.has_edge(a, b):
+                    self.graph[a][b]['weight'] += weight
+                else:
+                    self.graph.add_edge(a, b, weight=weight)
+        self._recount()
+
+    def _recount(self):
+        self.totals = {}
+        self.maxima = {}
+        for node, nbrs in self.graph.adjacency():
+            weights = [data['weight'] for data in nbrs.values()]
+            if weights:
+                self.totals[node] = sum(weights)
+                self.maxima[node] = max(weights)
+
+    def add(self, a, b, weight=1, ts=None):
+        """Add weight to the edge a-b at time ts, creating it if needed; returns the new stored weight"""
+        weight = self._frame_weight(weight, ts)
+        if self.graph.has_edge(a, b):
+            data = self.graph[a][b]
+            data['weight'] += weight
+            new_weight = data['weight']
+        else:
+            self.graph.add_edge(a, b, weight=weight)
+            new_weight = weight
+        for node in ((a, b) if a != b else (a,)):
+            self.totals[node] = self.totals.get(node, 0) + weight
+            if new_weight > self.maxima.get(node, 0):
+                self.maxima[node] = new_weight
+        return new_weight
+
+    def weight(self, a, b):
+        data = self.graph.get_edge_data(a, b)
+        return data['weight'] if data is not None else 0
+
+    def aggregates(self, node):
+        """Total weight, number and heaviest weight of the node's edges"""
+        if node not in self.graph:
+            return 0, 0, 0
+        return self.totals[node], len(self.graph[node]), self.maxima[node]
+
+    def compact(self, ts, min_weight):
+        """Rebase the decay frame to ts and drop edges whose weight fell below min_weight.
+
+        Returns the dropped (node, node) pairs.
+        """
+        factor = self.scale(ts)
+        dropped = []
+        for a, b, data in self.graph.edges(data=True):
+            data['weight'] *= factor
+            if data['weight'] < min_weight:
+                dropped.append((a, b))
+        self.graph.remove_edges_from(dropped)
+        self.graph.remove_nodes_from([node for node, degree in self.graph.degree() if degree == 0])
+        self.t0 = ts
+        self._recount()
+        return dropped
+
+    def edges(self):
+        return self.graph.edges(data='weight')
+
+    def number_of_edges(self):
+        return self.graph.number_of_edges()
+
+    def number_of_nodes(self):
+        return self.graph.number_of_nodes()
+
+
+class NodeTable:
+    """Interns string node IDs to dense ints without a Python object per node.
+
+    Names are stored UTF-8 encoded in one bytearray with an offsets array,
+    and found through an open-addressing hash table held in two NumPy arrays
+    (the name's hash and its id; hash 0 marks an empty slot). The last
+    RECENT_NODES names looked up are also kept in a small dict, since a
+    transaction looks up its two endpoints several times.
+    """
+
+    def __init__(self, names=()):
+        self.blob = bytearray()
+        self.offsets = np.zeros(1024, dtype=np.int64)
+        self.count = 0
+        self.hashes = np.zeros(2048, dtype=np.int64)
+        self.table_ids = np.zeros(2048, dtype=np.int32)
+        self.recent = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return self.count
+
+    def name(self, node):
+        return self.blob[self.offsets.item(node):self.offsets.item(node + 1)].decode()
+
+    def _probe(self, name, h):
+        """(table slot, id) of name, or (first empty slot, None)"""
+        mask = len(self.hashes) - 1
+        slot = h & mask
+        while True:
+            stored = self.hashes.item(slot)
+            if stored == 0:
+                return slot, None
+            if stored == h:
+                node = self.table_ids.item(slot)
+                if self.name(node) == name:
+                    return slot, node
+            slot = (slot + 1) & mask
+
+    def _remember(self, name, node):
+        if len(self.recent) >= RECENT_NODES:
+            self.recent.clear()
+        self.recent[name] = node
+
+    def get(self, name):
+        node = self.recent.get(name)
+        if node is None:
+            node = self._probe(name, hash(name) or 1)[1]
+            if node is not None:
+                self._remember(name, node)
+        return node
+
+    def add(self, name):
+        """Id of name, interning it if new"""
+        node = self.recent.get(name)
+        if node is not None:
+            return node
+        h = hash(name) or 1
+        slot, node = self._probe(name, h)
+        if node is not None:
+            self._remember(name, node)
+            return node
+        node = self.count
+        encoded = name.encode()
+        if node + 1 == len(self.offsets):
+            self.offsets = _grow(self.offsets, node + 1)
+        self.blob += encoded
+        self.offsets[node + 1] = self.offsets.item(node) + len(encoded)
+        self.hashes[slot] = h
+        self.table_ids[slot] = node
+        self.count += 1
+        self._remember(name, node)
+        if 2 * self.count > len(self.hashes):
+            self._rehash()
+        return node
+
+    def _rehash(self):
+        hashes, table_ids = self.hashes[self.hashes != 0], self.table_ids[self.hashes != 0]
+        self.hashes = np.zeros(2 * len(self.hashes), dtype=np.int64)
+        self.table_ids = np.zeros(len(self.hashes), dtype=np.int32)
+        mask = len(self.hashes) - 1
+        # Vectorized linear probing: each round places every entry whose probe slot is
+        # free (one per slot), and the others move on to the next slot
+        slots = hashes & mask
+        pending = np.arange(len(hashes))
+        while pending.size:
+            candidates = slots[pending]
+            free = self.hashes[candidates] == 0
+            taken, first = np.unique(candidates[free], return_index=True)
+            winners = pending[free][first]
+            self.hashes[taken] = hashes[winners]
+            self.table_ids[taken] = table_ids[winners]
+            placed = np.zeros(len(hashes), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed[pending]]
+            slots[pending] = (slots[pending] + 1) & mask
+
+
+class ArrayGraph(DecayFrame):
+    """Weighted graph in typed NumPy arrays, with the same interface as NetworkXGraph.
+
+    Node IDs are interned to integers by a NodeTable. Each edge is one slot in growable
+    int32 endpoint and float64 weight arrays. Edges are found by binary search
+    over a sorted int64 array of packed endpoint pairs with a parallel array
+    of slots; edges added since the last merge sit in a small dict until it
+    is merged in. Per-node weight totals, degrees and maxima are kept
+    alongside, so `aggregates()` needs no adjacency lists. No Python object
+    is kept per edge or per node.
+    """
+
+    def __init__(self, decay=0.0, capacity=1024):
+        super().__init__(decay)
+        self.nodes = NodeTable()
+        self.keys = np.empty(0, dtype=np.int64)   # sorted packed endpoint ids
+        self.slots = np.empty(0, dtype=np.int32)  # edge slot of each key
+        self.delta = {}   # packed endpoint ids -> edge slot, for edges not merged into keys yet
+        self.n_edges = 0
+        self.src = np.empty(capacity, dtype=np.int32)
+        self.dst = np.empty(capacity, dtype=np.int32)
+        self.weights = np.empty(capacity, dtype=np.float64)
+        self.node_total = np.zeros(capacity, dtype=np.float64)
+        self.node_degree = np.zeros(capacity, dtype=np.int32)
+        self.node_max = np.zeros(capacity, dtype=np.float64)
+
+    def _node(self, name):
+        node = self.nodes.add(name)
+        if node == len(self.node_total):
+            self.node_total = _grow(self.node_total, node, zero=True)
+            self.node_degree = _grow(self.node_degree, node, zero=True)
+            self.node_max = _grow(self.node_max, node, zero=True)
+        return node
+
+    def _find(self, key):
+        edge = self.delta.get(key)
+        if edge is None:
+            pos = int(self.keys.searchsorted(key))
+            if pos < len(self.keys) and self.keys.item(pos) == key:
+                edge = self.slots.item(pos)
+        return edge
+
+    def _merge_delta(self):
+        keys = np.fromiter(self.delta.keys(), dtype=np.int64, count=len(self.delta))
+        slots = np.fromiter(self.delta.values(), dtype=np.int32, count=len(self.delta))
+        order = keys.argsort()
+        positions = self.keys.searchsorted(keys[order])
+        self.keys = np.insert(self.keys, positions, keys[order])
+        self.slots = np.insert(self.slots, positions, slots[order])
+        self.delta = {}
+
+    def _edge(self, i, j):
+        """Slot of the edge between ids i and j, created with weight 0 if missing"""
+        key = (i << KEY_SHIFT | j) if i <= j else (j << KEY_SHIFT | i)
+        edge = self._find(key)
+        if edge is None:
+            edge = self.delta[key] = self.n_edges
+            if len(self.delta) >= max(DELTA_EDGES, self.n_edges // 32):
+                self._merge_delta()
+            if edge == len(self.weights):
+                self.src = _grow(self.src, edge)
+                self.dst = _grow(self.dst, edge)
+                self.weights = _grow(self.weights, edge)
+            self.src[edge] = i
+            self.dst[edge] = j
+            self.weights[edge] = 0.0
+            self.n_edges += 1
+            # item() avoids NumPy's slow int32 scalar arithmetic
+            self.node_degree[i] = self.node_degree.item(i) + 1
+            if j != i:
+                self.node_degree[j] = self.node_degree.item(j) + 1
+        return edge
+
+    def add_edges(self, edges):
+        for a, b, weight in edges:
+            self.add(a, b, weight)
+
+    def add(self, a, b, weight=1, ts=None):
+        weight = self._frame_weight(weight, ts)
+        i, j = self._node(a), self._node(b)
+        edge = self._edge(i, j)
+        new_weight = self.weights.item(edge) + weight
+        self.weights[edge] = new_weight
+        total, top = self.node_total, self.node_max
+        total[i] = total.item(i) + weight
+        if new_weight > top.item(i):
+            top[i] = new_weight
+        if j != i:
+            total[j] = total.item(j) + weight
+            if new_weight > top.item(j):
+                top[j] = new_weight
+        return new_weight
+
+    def weight(self, a, b):
+        i, j = self.nodes.get(a), self.nodes.get(b)
+        if i is None or j is None:
+            return 0
+        edge = self._find((i << KEY_SHIFT | j) if i <= j else (j << KEY_SHIFT | i))
+        return float(self.weights[edge]) if edge is not None else 0
+
+    def aggregates(self, node):
+        i = self.nodes.get(node)
+        if i is None:
+            return 0, 0, 0
+        return float(self.node_total[i]), int(self.node_degree[i]), float(self.node_max[i])
+
+    def compact(self, ts, min_weight):
+        n = self.n_edges
+        weights = self.weights[:n] * self.scale(ts)
+        keep = weights >= min_weight
+        src, dst = self.src[:n], self.dst[:n]
+        name = self.nodes.name
+        dropped = [(name(i), name(j)) for i, j in zip(src[~keep].tolist(), dst[~keep].tolist())]
+        src, dst, weights = src[keep], dst[keep], weights[keep]
+
+        # Re-intern the nodes that still have edges
+        used = np.unique(np.concatenate([src, dst]))
+        remap = np.full(len(self.nodes), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        self.nodes = NodeTable(name(i) for i in used.tolist())
+        src, dst = remap[src], remap[dst]
+
+        self.n_edges = len(weights)
+        capacity = max(1024, 2 * self.n_edges)
+        self.src, self.dst, self.weights = (_sized(array, capacity) for array in (src, dst, weights))
+        keys = (np.minimum(src, dst).astype(np.int64) << KEY_SHIFT) | np.maximum(src, dst).astype(np.int64)
+        order = keys.argsort()
+        self.keys, self.slots, self.delta = keys[order], order.astype(np.int32), {}
+
+        # Self-loops count once towards their node, as in add()
+        nodes = max(1024, 2 * len(self.nodes))
+        loops = src == dst
+        total = (np.bincount(src, weights, nodes) + np.bincount(dst, weights, nodes)
+                 - np.bincount(src[loops], weights[loops], nodes))
+        degree = np.bincount(src, minlength=nodes) + np.bincount(dst, minlength=nodes) - np.bincount(src[loops], minlength=nodes)
+        self.node_total = total.astype(np.float64)
+        self.node_degree = degree.astype(np.int32)
+        self.node_max = np.zeros(nodes, dtype=np.float64)
+        np.maximum.at(self.node_max, src, weights)
+        np.maximum.at(self.node_max, dst, weights)
+        self.t0 = ts
+        return dropped
+
+    def edges(self):
+        name = self.nodes.name
+        n = self.n_edges
+        return ((name(i), name(j), w) for i, j, w in
+                zip(self.src[:n].tolist(), self.dst[:n].tolist(), self.weights[:n].tolist()))
+
+    def number_of_edges(self):
+        return self.n_edges
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+
+def _sized(array, capacity):
+    sized = np.empty(capacity, dtype=array.dtype)
+    sized[:len(array)] = array
+    return sized
+
+
+def _grow(array, used, zero=False):
+    """Double an array's capacity, keeping its first `used` entries"""
+    grown = (np.zeros if zero else np.empty)(max(2 * len(array), 1), dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+BACKENDS = {'networkx': NetworkXGraph, 'array': ArrayGraph}
+
+
+def make_graph(backend, decay=0.0):
+    """Create an empty graph for a COLLUSION_GRAPH_BACKEND name"""
+    try:
+        return BACKENDS[backend](decay)
+    except KeyError:
+        raise ValueError(f"Unknown graph backend {backend!r}; expected one of {', '.join(BACKENDS)}") from None
@@ -0,0 +1,188 @@
+# collusion_shards.py
+import multiprocessing
+import zlib
+
+from collusion_flows import FlowClock, FlowIndex, find_rings
+
+# Ops sent to a shard inside an 'apply' message
+EDGE, LOAD_EDGE, FLOW = 0, 1, 2
+
+
+class Shard:
+    """Graph state for the nodes owned by one worker process.
+
+    A node's undirected relationship weights live on its owner shard, so an
+    edge is stored once per endpoint. A flow src -> dst lives in the
+    FlowIndex of the owner of dst, which is where the backward ring search
+    needs it.
+    """
+
+    def __init__(self, max_fanout):
+        self.adj = {}   # node -> {neighbor: weight}
+        self.totals = {}  # node -> total weight of its edges
+        self.maxima = {}  # node -> heaviest edge weight
+        self.flows = FlowIndex(max_fanout)
+
+    def apply(self, ops):
+        """Apply edge and flow updates in order; returns (index, weight, average weight) per reported edge"""
+        results = []
+        for op in ops:
+            if op[0] == EDGE:
+                _, index, node, nbr, report = op
+                nbrs = self.adj.setdefault(node, {})
+                nbrs[nbr] = weight = nbrs.get(nbr, 0) + 1
+                self._count(node, 1, weight)
+                if report:
+                    results.append((index, weight, self.totals[node] / len(nbrs)))
+            elif op[0] == LOAD_EDGE:
+                _, node, nbr, weight = op
+                nbrs = self.adj.setdefault(node, {})
+                nbrs[nbr] = nbrs.get(nbr, 0) + weight
+                self._count(node, weight, nbrs[nbr])
+            else:
+                _, dst, src, ts, seq, tx_id, amount = op
+                self.flows.record(src, dst, ts, seq, tx_id, amount)
+        return results
+
+    def _count(self, node, added, new_weight):
+        self.totals[node] = self.totals.get(node, 0) + added
+        if new_weight > self.maxima.get(node, 0):
+            self.maxima[node] = new_weight
+
+    def aggregates(self, node):
+        """Total weight, number and heaviest weight of the node's edges"""
+        if node not in self.adj:
+            return 0, 0, 0
+        return self.totals[node], len(self.adj[node]), self.maxima[node]
+
+    def expand(self, requests):
+        return self.flows.expand(requests)
+
+    def evict(self, cutoff):
+        return self.flows.evict(cutoff)
+
+    def edges(self):
+        """Each stored edge once, as (node, neighbor, weight)"""
+        return [(node, nbr, weight) for node, nbrs in self.adj.items()
+                for nbr, weight in nbrs.items() if node <= nbr]
+
+
+def _serve(conn, max_fanout):
+    shard = Shard(max_fanout)
+    while True:
+        method, args = conn.recv()
+        if method == 'stop':
+            break
+        conn.send(getattr(shard, method)(*args))
+
+
+class ShardPool:
+    """Routes graph work to shard processes over local pipes.
+
+    Nodes are assigned to shards by a stable hash of their ID. `apply()` runs
+    a batch of transactions: every shard applies its share of the updates in
+    input order, then the ring searches for the whole batch advance one hop
+    per round across all shards (collusion_flows.find_rings, the same search
+    the single-process detector runs), so a ring may span any number of shards.
+    """
+
+    def __init__(self, shards, min_hops, max_hops, window_seconds, max_fanout, max_frontier):
+        self.min_hops = min_hops
+        self.max_hops = max_hops
+        self.window_seconds = window_seconds
+        self.max_frontier = max_frontier
+        self.clock = FlowClock(window_seconds)
+        self.seq = 0
+        self.pending = [[] for _ in range(shards)]  # ops queued until the next flush()
+
+        # Forked before the API starts any threads; shards never touch the parent's SQLite handle
+        ctx = multiprocessing.get_context('fork')
+        self.pipes, self.processes = [], []
+        for i in range(shards):
+            parent_end, child_end = ctx.Pipe()
+            process = ctx.Process(target=_serve, args=(child_end, max_fanout),
+                                  name=f"collusion-shard-{i}", daemon=True)
+            process.start()
+            child_end.close()
+            self.pipes.append(parent_end)
+            self.processes.append(process)
+
+    def shard_of(self, node):
+        return zlib.crc32(node.encode()) % len(self.pipes)
+
+    def _call(self, method, args_by_shard):
+        """Send one request per shard, then collect the replies; shards work in parallel meanwhile"""
+        for i, args in args_by_shard.items():
+            self.pipes[i].send((method, args))
+        return {i: self.pipes[i].recv() for i in args_by_shard}
+
+    def load_edge(self, node, nbr, weight):
+        self.pending[self.shard_of(node)].append((LOAD_EDGE, node, nbr, weight))
+        if nbr != node:
+            self.pending[self.shard_of(nbr)].append((LOAD_EDGE, nbr, node, weight))
+
+    def record_flow(self, src, dst, ts, tx_id, amount, seq=0):
+        self.clock.observe(ts)
+        self.pending[self.shard_of(dst)].append((FLOW, dst, src, ts, seq, tx_id, amount))
+
+    def flush(self):
+        """Apply queued ops; returns the edge results reported by every shard"""
+        ops = {i: (shard_ops,) for i, shard_ops in enumerate(self.pending) if shard_ops}
+        self.pending = [[] for _ in self.pipes]
+        return [result for results in self._call('apply', ops).values() for result in results]
+
+    def aggregates(self, node):
+        shard = self.shard_of(node)
+        return self._call('aggregates', {shard: (node,)})[shard]
+
+    def edges(self):
+        replies = self._call('edges', {i: () for i in range(len(self.pipes))})
+        return [edge for i in sorted(replies) for edge in replies[i]]
+
+    def apply(self, txs):
+        """Process (employee_id, customer_id, epoch, transaction_id, amount) tuples in order.
+
+        Returns one (weight, average employee edge weight, ring) per transaction,
+        where ring is a list of (src, dst, (epoch, transaction_id, amount)) hops
+        in flow order closing with an earlier flow into the employee, or None.
+        """
+        searches = []
+        for index, (emp_id, cust_id, ts, tx_id, amount) in enumerate(txs):
+            self.seq += 1
+            if self.clock.observe(ts):
+                searches.append((index, emp_id, cust_id, ts, self.seq))
+            self.pending[self.shard_of(emp_id)].append((EDGE, index, emp_id, cust_id, True))
+            if cust_id != emp_id:
+                self.pending[self.shard_of(cust_id)].append((EDGE, index, cust_id, emp_id, False))
+            self.pending[self.shard_of(cust_id)].append((FLOW, cust_id, emp_id, ts, self.seq, tx_id, amount))
+
+        weights = [None] * len(txs)
+        for index, weight, avg in self.flush():
+            weights[index] = (weight, avg)
+        rings = find_rings(searches, self._expand, self.min_hops, self.max_hops,
+                           self.window_seconds, self.max_frontier)
+        self.evict_if_due()
+        return [weights[i] + (rings.get(i),) for i in range(len(txs))]
+
+    def evict_if_due(self):
+        cutoff = self.clock.sweep_cutoff()
+        if cutoff is not None:
+            self._call('evict', {i: (cutoff,) for i in range(len(self.pipes))})
+
+    def _expand(self, requests):
+        """FlowIndex.expand across shards: each request goes to the owner of its node"""
+        by_shard = {}
+        for k, request in enumerate(requests):
+            by_shard.setdefault(self.shard_of(request[0]), []).append((k, request))
+        replies = self._call('expand', {s: ([request for _, request in items],) for s, items in by_shard.items()})
+        answers = [None] * len(requests)
+        for s, items in by_shard.items():
+            for (k, _), answer in zip(items, replies[s]):
+                answers[k] = answer
+        return answers
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(('stop', ()))
+        for process in self.processes:
+            process.join(timeout=5)
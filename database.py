@@ -0,0 +1,159 @@
+# database.py
+import fcntl
+import json
+import os
+import sqlite3
+
+DB_PATH = "transactions.db"
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
+
+def connect(db_path=DB_PATH, **kwargs):
+    """Open a connection with the pragmas every long-lived connection should use"""
+    conn = sqlite3.connect(db_path, timeout=30, **kwargs)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+    return conn
+
+
+def history_query(columns):
+    """SELECT of the given transactions columns past a rowid watermark, in rowid order.
+
+    rowid is used as the watermark because rows inserted by app.py have no ID
+    value. Rows still waiting for background scoring are not history yet, so
+    the watermark stops before them. Derived stores read their rows with this
+    rather than having them passed in, so rows inserted by other worker
+    processes are picked up as well.
+    """
+    return f'''
+    SELECT {columns}
+    FROM transactions
+    WHERE rowid > ?
+      AND rowid < COALESCE((SELECT MIN(rowid) FROM transactions WHERE status = 'pending'), 9223372036854775807)
+    ORDER BY rowid
+'''
+
+
+class FileLock:
+    """Exclusive flock on a lock file, shared by all processes using a store directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+def read_manifest(path):
+    """A store's JSON manifest, or None if it is missing or unreadable"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, manifest):
+    """Replace a store's JSON manifest atomically"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _create_transactions(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS transactions
+                    (ID TEXT PRIMARY KEY, CustomerID TEXT, CustomerID2 TEXT, Amount REAL,
+                     Date TEXT, Time TEXT, IP TEXT)''')
+    columns = _columns(conn, 'transactions')
+    if 'status' not in columns:
+        conn.execute('ALTER TABLE transactions ADD COLUMN status TEXT DEFAULT "normal"')
+    if 'explanation' not in columns:
+        conn.execute('ALTER TABLE transactions ADD COLUMN explanation TEXT')
+
+
+def _create_scoring_jobs(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS scoring_jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, txn_rowid INTEGER, payload TEXT,
+                     state TEXT DEFAULT 'queued', attempts INTEGER DEFAULT 0, error TEXT,
+                     claimed_by INTEGER, claimed_at REAL, enqueued_at REAL, updated_at REAL)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scoring_jobs_state ON scoring_jobs(state, id)')
+    # Pending rows are excluded from customer history, which needs a fast lookup by status
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions(status)')
+
+
+def _create_listing_indexes(conn):
+    # Newest-first listing, optionally within one status or sender; the CustomerID
+    # index also serves plain per-customer lookups
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date_time ON transactions(Date, Time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_date_time ON transactions(status, Date, Time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_customer_date_time ON transactions(CustomerID, Date, Time)')
+
+
+def _add_scoring_job_result(conn):
+    # The verdict is kept on the job once evaluated, so retrying a failed completion does not evaluate again
+    if 'result' not in _columns(conn, 'scoring_jobs'):
+        conn.execute('ALTER TABLE scoring_jobs ADD COLUMN result TEXT')
+
+
+def _create_alert_outbox(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS alert_outbox
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, customer_id TEXT,
+                     transaction_data TEXT, analysis TEXT, state TEXT DEFAULT 'pending',
+                     attempts INTEGER DEFAULT 0, error TEXT, created_at REAL,
+                     next_attempt_at REAL, claimed_at REAL, sent_at REAL)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alert_outbox_state ON alert_outbox(state, customer_id)')
+
+
+# Append new steps; never edit or reorder released ones. The position is the schema version.
+MIGRATIONS = [
+    _create_transactions,
+    _create_scoring_jobs,
+    _create_listing_indexes,
+    _add_scoring_job_result,
+    _create_alert_outbox,
+]
+
+
+def migrate(db_path=DB_PATH):
+    """Bring the schema up to date; returns the number of migrations applied.
+
+    The version lives in PRAGMA user_version and the check runs under BEGIN
+    IMMEDIATE, so when several workers start at once exactly one migrates and
+    the others find the schema current.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        # WAL is persistent, so setting it once here covers every later connection
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            pending = MIGRATIONS[version:]
+            for step in pending:
+                step(conn)
+            if pending:
+                conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    if pending:
+        print(f"Applied {len(pending)} schema migrations to {db_path} (now at version {len(MIGRATIONS)})")
+    return len(pending)
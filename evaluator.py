@@ -0,0 +1,175 @@
+# evaluator.py
+import asyncio
+import os
+import random
+import weakref
+from langchain.chains.question_answering import load_qa_chain
+
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))  # concurrent evaluations per event loop
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0  # seconds; doubled on every rate-limited retry
+BACKOFF_MAX = 30.0
+
+EVALUATION_PROMPT = """
+You are a fraud detection agent. A new transaction has occurred:
+
+CustomerID: {CustomerID}
+To: {CustomerID2}
+Amount: ${Amount}
+Date: {Date}
+Time: {Time}
+IP Address: {IP}
+
+Based on the customer's historical behavior, evaluate if this transaction is normal or suspicious.
+
+IMPORTANT: First provide a detailed analysis explaining your reasoning. Then determine the appropriate action by concluding with one of these exact phrases:
+- "ACTION: No action required" - If transaction is within normal patterns
+- "ACTION: Flag to admin" - If transaction shows slight deviation from normal patterns
+- "ACTION: Send Slack alert" - If transaction shows strong anomalies
+
+Your analysis must clearly explain the factors that led to your decision.
+"""
+
+
+class TransactionEvaluator:
+    """Long-lived fraud evaluator that builds its QA chain once.
+
+    Equivalent to building a customer-filtered RetrievalQA per call: the
+    customer's history is retrieved from their own index partition and passed
+    to the same "stuff" chain RetrievalQA uses, along with the prompt. With a
+    context_builder, its documents replace the vector search.
+    """
+
+    def __init__(self, llm, index, tools, prescorer=None, cache=None, k=5, max_in_flight=MAX_IN_FLIGHT,
+                 context_builder=None):
+        self.index = index
+        self.context_builder = context_builder
+        self.tools = tools
+        self.prescorer = prescorer
+        self.cache = cache if cache is not None and cache.enabled else None
+        self.k = k
+        self.max_in_flight = max_in_flight
+        self.combine_chain = load_qa_chain(llm, chain_type="stuff")
+        # asyncio primitives are bound to a loop, so keep one semaphore per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def evaluate(self, new_txn):
+        """Evaluate a transaction dict and run the resulting action"""
+        screened = self.prescreen(new_txn)
+        if screened is not None:
+            return screened
+
+        prompt = EVALUATION_PROMPT.format(**new_txn)
+        docs = self.retrieve(prompt, new_txn)
+        cache_key, response = self._cached(new_txn, docs)
+        if response is None:
+            response = self.combine_chain.run(input_documents=docs, question=prompt)
+            self._store(cache_key, response)
+        return self.act(new_txn, response)
+
+    async def aevaluate(self, new_txn):
+        """Async evaluate(): at most max_in_flight evaluations run at once on this loop.
+
+        Retrieval (query embedding + FAISS, or SQLite), verdict cache reads and
+        writes (SQLite when persisted) and the blocking action tools run in worker
+        threads; the LLM call is awaited and retried with backoff when the
+        provider rate-limits us.
+        """
+        async with self._semaphore():
+            screened = self.prescreen(new_txn)
+            if screened is not None:
+                return screened
+
+            prompt = EVALUATION_PROMPT.format(**new_txn)
+            docs = await asyncio.to_thread(self.retrieve, prompt, new_txn)
+            cache_key, response = await asyncio.to_thread(self._cached, new_txn, docs)
+            if response is None:
+                response = await self._arun_chain(docs, prompt)
+                await asyncio.to_thread(self._store, cache_key, response)
+            return await asyncio.to_thread(self.act, new_txn, response)
+
+    async def aevaluate_many(self, new_txns):
+        """Evaluate transactions concurrently; results are in submission order"""
+        return await asyncio.gather(*(self.aevaluate(txn) for txn in new_txns))
+
+    async def _arun_chain(self, docs, prompt):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return await self.combine_chain.arun(input_documents=docs, question=prompt)
+            except Exception as e:
+                if attempt == MAX_RETRIES or not _is_rate_limit(e):
+                    raise
+                delay = _retry_after(e) or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                # Jitter keeps concurrent evaluations from retrying in lockstep
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    def _cached(self, new_txn, docs):
+        """Return (cache key, cached response or None)"""
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(new_txn, docs)
+        return key, self.cache.get(key)
+
+    def _store(self, cache_key, response):
+        if self.cache is not None:
+            self.cache.put(cache_key, response)
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    def prescreen(self, new_txn):
+        """Return a no-action result if the numeric pre-screen clears the transaction, else None"""
+        if self.prescorer is None:
+            return None
+        prescore = self.prescorer.score(new_txn)
+        if prescore.escalate:
+            return None
+
+        details = "; ".join(prescore.reasons) or "amount, recipient, IP and hour all match past behavior"
+        response = (
+            f"Pre-screen score {prescore.score:.2f} is below the escalation threshold "
+            f"{self.prescorer.threshold:.2f} ({details}), so the transaction was not sent for LLM review.\n\n"
+            "ACTION: No action required"
+        )
+        return f"{response}\n\nSystem: No action required for this transaction."
+
+    def retrieve(self, prompt, new_txn):
+        """Fetch the history context: the context builder's documents, else the customer's k most similar past transactions"""
+        if self.context_builder is not None:
+            return self.context_builder.documents(new_txn)
+        return self.index.similarity_search(prompt, k=self.k, customer_id=new_txn['CustomerID'])
+
+    def act(self, new_txn, response):
+        """Dispatch the ACTION the model chose and append the outcome"""
+        # Extract the analysis part (everything before the ACTION line)
+        analysis_parts = response.split("ACTION:")
+        analysis = analysis_parts[0].strip()
+
+        # Determine which action to take
+        if "Send Slack alert" in response:
+            action_result = self.tools.send_slack_alert(new_txn, analysis)
+        elif "Flag to admin" in response:
+            action_result = self.tools.flag_to_admin(new_txn, analysis)
+        else:
+            action_result = "No action required for this transaction."
+
+        # Return the full response with analysis and action taken
+        return f"{response}\n\nSystem: {action_result}"
+
+
+def _is_rate_limit(error):
+    """True for HTTP 429 / rate-limit errors raised by the LLM client"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "ratelimit" in type(error).__name__.lower()
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
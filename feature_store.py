@@ -0,0 +1,313 @@
+# feature_store.py
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+import database
+
+STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store")
+STORE_FORMAT = 1  # bump when the on-disk layout changes; older layouts are rebuilt
+MANIFEST_FILE = "manifest.json"
+SYMBOLS_FILE = "symbols.jsonl"
+LOCK_FILE = ".lock"
+OPEN_PARTITIONS = int(os.getenv("FEATURE_STORE_OPEN_PARTITIONS", "256"))  # memory maps kept open
+SYNC_BATCH_SIZE = 10000
+
+# One append-only file per column in every customer's directory. Counterparties and
+# IPs are stored as ids into the shared symbol table.
+COLUMNS = (
+    ("rowid", np.int64),
+    ("epoch", np.float64),
+    ("amount", np.float64),
+    ("counterparty", np.int32),
+    ("ip", np.int32),
+)
+
+WINDOWS = (("1h", 3600), ("24h", 24 * 3600), ("30d", 30 * 24 * 3600))
+
+HISTORY_QUERY = database.history_query("rowid, CustomerID, CustomerID2, Amount, Date, Time, IP")
+
+
+def to_epoch(date_str, time_str):
+    """Seconds since the epoch for a transaction's Date and Time (read as UTC); NaN if unparseable"""
+    try:
+        moment = datetime.fromisoformat(f"{date_str}T{time_str}")
+    except (TypeError, ValueError):
+        return float("nan")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+class CustomerColumns:
+    """Read-only memory maps of one customer's column files.
+
+    Files only ever grow, so the maps are refreshed when a file is longer than
+    when it was mapped. Rows count as present once every column has them, which
+    hides appends that another process has only partly written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.length = 0
+        self.arrays = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+    def refresh(self):
+        lengths = []
+        for name, dtype in COLUMNS:
+            try:
+                lengths.append(os.path.getsize(os.path.join(self.path, name)) // np.dtype(dtype).itemsize)
+            except OSError:
+                lengths.append(0)
+        length = min(lengths)
+        if length != self.length:
+            self.arrays = {
+                name: np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=(length,))
+                if length else np.empty(0, dtype=dtype)
+                for name, dtype in COLUMNS
+            }
+            self.length = length
+        return self
+
+
+class FeatureStore:
+    """Per-customer transaction history in append-only, memory-mapped columnar files.
+
+    Each customer has a directory holding one flat binary file per column, in
+    the order the rows were inserted. The last N transactions are the tail
+    slice of those maps, and rolling aggregates are vectorized over a
+    customer's columns only, so neither touches SQLite or other customers.
+
+    The manifest records the highest rowid that has been appended, so a
+    restart only reads the rows added since then. A file lock lets several
+    worker processes sync the same directory; readers need no lock.
+    """
+
+    def __init__(self, db_path=database.DB_PATH, store_dir=STORE_DIR, open_partitions=OPEN_PARTITIONS):
+        self.db_path = db_path
+        self.store_dir = store_dir
+        self.open_partitions = open_partitions
+        self.symbols = []     # id -> counterparty or IP
+        self.symbol_ids = {}  # counterparty or IP -> id
+        self._symbols_offset = 0  # bytes of the symbol file already loaded
+        self._stored_symbols = 0  # symbols known to be in the file
+        self._partitions = OrderedDict()  # customer -> CustomerColumns, least recently used first
+        self.lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.store_dir, MANIFEST_FILE)
+
+    def _customer_dir(self, customer_id):
+        return os.path.join(self.store_dir, "customers", quote(str(customer_id), safe=""))
+
+    def load(self):
+        """Open the store on disk, rebuilding it if its format is outdated, then append any new rows"""
+        manifest = database.read_manifest(self.manifest_path)
+        if manifest is not None and manifest.get("format") != STORE_FORMAT:
+            print("Feature store on disk has an old format, building from scratch.")
+            return self.rebuild()
+        added = self.sync()
+        print(f"Loaded feature store: {added} transactions appended")
+        return self
+
+    def rebuild(self):
+        """Drop the files on disk and rebuild the whole store from the transactions table"""
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        with self.lock:
+            self.symbols = []
+            self.symbol_ids = {}
+            self._symbols_offset = 0
+            self._stored_symbols = 0
+            self._partitions.clear()
+        added = self.sync()
+        print(f"Rebuilt feature store: {added} transactions appended")
+        return self
+
+    def sync(self):
+        """Append rows inserted since the manifest's watermark; returns how many were appended"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        added = 0
+        with self.lock, database.FileLock(os.path.join(self.store_dir, LOCK_FILE)):
+            self._load_symbols()
+            manifest = database.read_manifest(self.manifest_path) or {}
+            last_rowid = manifest.get("last_rowid", 0)
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.execute(HISTORY_QUERY, (last_rowid,))
+                while True:
+                    rows = cursor.fetchmany(SYNC_BATCH_SIZE)
+                    if not rows:
+                        break
+                    added += self._append(rows)
+                    last_rowid = rows[-1][0]
+            finally:
+                conn.close()
+            if last_rowid != manifest.get("last_rowid", 0):
+                database.write_manifest(self.manifest_path, {"format": STORE_FORMAT, "last_rowid": last_rowid})
+        return added
+
+    def _append(self, rows):
+        by_customer = {}
+        for rowid, customer_id, counterparty, amount, date_str, time_str, ip in rows:
+            by_customer.setdefault(customer_id, []).append(
+                (rowid, to_epoch(date_str, time_str), float(amount or 0),
+                 self._symbol(counterparty), self._symbol(ip))
+            )
+        self._flush_symbols()
+
+        appended = 0
+        for customer_id, records in by_customer.items():
+            path = self._customer_dir(customer_id)
+            os.makedirs(path, exist_ok=True)
+            columns = CustomerColumns(path).refresh()
+            # Skip rows that made it into the files but not the manifest (crash between writes),
+            # and cut off any partly written row so all columns line up again
+            if columns.length:
+                last_stored = int(columns.arrays["rowid"][-1])
+                records = [record for record in records if record[0] > last_stored]
+            for name, dtype in COLUMNS:
+                file_path = os.path.join(path, name)
+                if os.path.exists(file_path) and os.path.getsize(file_path) != columns.length * np.dtype(dtype).itemsize:
+                    os.truncate(file_path, columns.length * np.dtype(dtype).itemsize)
+            if not records:
+                continue
+            values = list(zip(*records))
+            for (name, dtype), column in zip(COLUMNS, values):
+                with open(os.path.join(path, name), "ab") as f:
+                    f.write(np.asarray(column, dtype=dtype).tobytes())
+            appended += len(records)
+        return appended
+
+    def _symbol(self, value):
+        value = "" if value is None else str(value)
+        symbol = self.symbol_ids.get(value)
+        if symbol is None:
+            symbol = self.symbol_ids[value] = len(self.symbols)
+            self.symbols.append(value)
+        return symbol
+
+    def _load_symbols(self):
+        """Read symbols appended to the shared table since this process last looked"""
+        path = os.path.join(self.store_dir, SYMBOLS_FILE)
+        try:
+            with open(path, "rb") as f:
+                f.seek(self._symbols_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Ignore a trailing line without a newline; it is still being written
+        data = data[:data.rfind(b"\n") + 1]
+        for line in data.splitlines():
+            value = json.loads(line)
+            # The line number is the id
+            self.symbol_ids.setdefault(value, len(self.symbols))
+            self.symbols.append(value)
+        self._symbols_offset += len(data)
+        self._stored_symbols = len(self.symbols)
+
+    def _flush_symbols(self):
+        """Append symbols interned since the last flush to the shared table (under the file lock)"""
+        new = self.symbols[self._stored_symbols:]
+        if not new:
+            return
+        data = "".join(json.dumps(value) + "\n" for value in new).encode()
+        with open(os.path.join(self.store_dir, SYMBOLS_FILE), "ab") as f:
+            # Drop a line left half written by a crashed writer before appending after it
+            f.truncate(self._symbols_offset)
+            f.write(data)
+        self._symbols_offset += len(data)
+        self._stored_symbols = len(self.symbols)
+
+    def _columns(self, customer_id):
+        with self.lock:
+            columns = self._partitions.get(customer_id)
+            if columns is None:
+                path = self._customer_dir(customer_id)
+                if not os.path.isdir(path):
+                    return None
+                columns = self._partitions[customer_id] = CustomerColumns(path)
+                if len(self._partitions) > self.open_partitions:
+                    self._partitions.popitem(last=False)
+            else:
+                self._partitions.move_to_end(customer_id)
+            columns.refresh()
+            return columns if columns.length else None
+
+    def _decode(self, ids):
+        with self.lock:
+            if ids and max(ids) >= len(self.symbols):
+                # Written by another process since this one last read the symbol table
+                self._load_symbols()
+            return [self.symbols[i] for i in ids]
+
+    def count(self, customer_id):
+        columns = self._columns(customer_id)
+        return columns.length if columns is not None else 0
+
+    def last_n(self, customer_id, n=10):
+        """The customer's n most recently recorded transactions, oldest first"""
+        columns = self._columns(customer_id)
+        if columns is None:
+            return []
+        tail = {name: array[-n:].tolist() for name, array in columns.arrays.items()}
+        counterparties, ips = self._decode(tail["counterparty"]), self._decode(tail["ip"])
+        return [{
+            "rowid": rowid,
+            "Timestamp": datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            if epoch == epoch else None,
+            "Amount": amount,
+            "CustomerID2": counterparty,
+            "IP": ip,
+        } for rowid, epoch, amount, counterparty, ip in zip(
+            tail["rowid"], tail["epoch"], tail["amount"], counterparties, ips)]
+
+    def rolling(self, customer_id, now=None, windows=WINDOWS):
+        """Count, amount sum and distinct counterparties and IPs per trailing window ending at `now`.
+
+        `now` is an epoch (see to_epoch); it defaults to the customer's latest
+        transaction. Returns {window name: {"count", "sum", "counterparties", "ips"}}.
+        """
+        columns = self._columns(customer_id)
+        if columns is None:
+            return {name: {"count": 0, "sum": 0.0, "counterparties": 0, "ips": 0} for name, _ in windows}
+        epoch = np.asarray(columns.arrays["epoch"])
+        if now is None:
+            now = float(np.nanmax(epoch)) if not np.isnan(epoch).all() else 0.0
+        amount = np.asarray(columns.arrays["amount"])
+        counterparty = np.asarray(columns.arrays["counterparty"])
+        ip = np.asarray(columns.arrays["ip"])
+
+        # Rows are in insertion order, not time order, so each window is a mask;
+        # NaN epochs compare false and fall outside every window
+        ages = now - epoch
+        result = {}
+        for name, seconds in windows:
+            mask = (ages >= 0) & (ages < seconds)
+            result[name] = {
+                "count": int(mask.sum()),
+                "sum": float(amount[mask].sum()),
+                "counterparties": int(np.unique(counterparty[mask]).size),
+                "ips": int(np.unique(ip[mask]).size),
+            }
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the columnar per-customer feature store")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the store from the transactions table")
+    args = parser.parse_args()
+
+    store = FeatureStore()
+    if args.rebuild:
+        store.rebuild()
+    else:
+        store.load()
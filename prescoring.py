@@ -0,0 +1,124 @@
+# prescoring.py
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter, namedtuple
+
+import database
+
+PRESCORE_THRESHOLD = float(os.getenv("PRESCORE_THRESHOLD", "3.0"))
+MIN_HISTORY = int(os.getenv("PRESCORE_MIN_HISTORY", "5"))  # fewer past transactions always escalate
+
+# Penalties added to the amount z-score for each unusual attribute
+NEW_COUNTERPARTY_PENALTY = 1.5
+NEW_IP_PENALTY = 2.0
+RARE_HOUR_PENALTY = 1.0
+RARE_HOUR_SHARE = 0.05  # an hour (+/- 1) seen in less than 5% of history is unusual
+
+PROFILE_QUERY = database.history_query("rowid, CustomerID, CustomerID2, Amount, Time, IP")
+
+PreScore = namedtuple("PreScore", ["score", "escalate", "reasons"])
+
+
+def _hour(time_str):
+    try:
+        return int(str(time_str).split(":")[0]) % 24
+    except (TypeError, ValueError):
+        return None
+
+
+class CustomerProfile:
+    """Running statistics of one customer's past transactions"""
+
+    __slots__ = ("count", "mean", "m2", "counterparties", "ips", "hours")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations (Welford)
+        self.counterparties = Counter()
+        self.ips = Counter()
+        self.hours = [0] * 24
+
+    def update(self, amount, counterparty, ip, hour):
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+        self.counterparties[counterparty] += 1
+        self.ips[ip] += 1
+        if hour is not None:
+            self.hours[hour] += 1
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def score(self, amount, counterparty, ip, hour):
+        reasons = []
+        # Floor the deviation so customers with near-constant amounts are not flagged for cents
+        std = max(self.std, 0.1 * abs(self.mean), 1.0)
+        z = abs(amount - self.mean) / std
+        score = z
+        if z >= 1:
+            reasons.append(f"amount ${amount:,.2f} is {z:.1f} std from the usual ${self.mean:,.2f}")
+
+        if counterparty not in self.counterparties:
+            score += NEW_COUNTERPARTY_PENALTY
+            reasons.append(f"first transfer to {counterparty}")
+        if ip not in self.ips:
+            score += NEW_IP_PENALTY
+            reasons.append(f"new IP address {ip}")
+        if hour is not None:
+            nearby = self.hours[(hour - 1) % 24] + self.hours[hour] + self.hours[(hour + 1) % 24]
+            if nearby < RARE_HOUR_SHARE * self.count:
+                score += RARE_HOUR_PENALTY
+                reasons.append(f"unusual hour {hour:02d}:00")
+        return score, reasons
+
+
+class PreScorer:
+    """Deterministic numeric screen run before the LLM.
+
+    Keeps a CustomerProfile per customer (amount mean/variance, counterparties,
+    IPs and an hour-of-day histogram) and scores a new transaction against it in
+    constant time. Only transactions scoring above the threshold, or from
+    customers without enough history, need the LLM.
+    """
+
+    def __init__(self, db_path=database.DB_PATH, threshold=PRESCORE_THRESHOLD, min_history=MIN_HISTORY):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.min_history = min_history
+        self.profiles = {}
+        self.last_rowid = 0
+        self.lock = threading.Lock()
+
+    def sync(self):
+        """Fold rows inserted since the last sync into the profiles"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with self.lock:
+                rows = conn.execute(PROFILE_QUERY, (self.last_rowid,)).fetchall()
+                for rowid, customer_id, counterparty, amount, time_str, ip in rows:
+                    profile = self.profiles.get(customer_id)
+                    if profile is None:
+                        profile = self.profiles[customer_id] = CustomerProfile()
+                    profile.update(float(amount or 0), counterparty, ip, _hour(time_str))
+                    self.last_rowid = rowid
+        finally:
+            conn.close()
+        return len(rows)
+
+    def score(self, txn):
+        """Score a transaction dict (CustomerID, CustomerID2, Amount, Time, IP)"""
+        with self.lock:
+            profile = self.profiles.get(txn["CustomerID"])
+            if profile is None or profile.count < self.min_history:
+                count = profile.count if profile is not None else 0
+                return PreScore(math.inf, True, [f"only {count} past transactions on record"])
+            score, reasons = profile.score(
+                float(txn["Amount"]), txn["CustomerID2"], txn["IP"], _hour(txn["Time"])
+            )
+        return PreScore(score, score >= self.threshold, reasons)
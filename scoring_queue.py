@@ -0,0 +1,159 @@
+# scoring_queue.py
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import database
+
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("SCORING_MAX_ATTEMPTS", "3"))
+JOB_LEASE = float(os.getenv("SCORING_JOB_LEASE", "600"))  # seconds before a running job may be reclaimed
+POLL_INTERVAL = 5.0  # seconds; workers also wake up immediately on notify()
+
+
+def enqueue(conn, txn_rowid, txn_data):
+    """Add a scoring job on the caller's connection, inside the caller's transaction"""
+    now = time.time()
+    conn.execute(
+        'INSERT INTO scoring_jobs (txn_rowid, payload, state, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+        (txn_rowid, json.dumps(txn_data), 'queued', now, now)
+    )
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScoringQueue:
+    """Durable SQLite-backed queue of transactions waiting for evaluation.
+
+    Jobs live in the scoring_jobs table, so anything still queued or running
+    when the process dies is picked up again on restart. Worker threads claim
+    jobs one at a time, call `evaluate(txn_data)` and hand the result to
+    `complete(txn_rowid, result)`; failures are retried up to MAX_ATTEMPTS and
+    then reported through `fail(txn_rowid, error)`. The result is saved on the
+    job before `complete` runs, so a retry after a failed `complete` reuses it
+    instead of evaluating (and alerting) again. With `drain_only` the workers
+    exit once no job is left, for processes that do not score in the background
+    but must not leave earlier jobs (and their pending rows) behind.
+    """
+
+    def __init__(self, evaluate, complete, fail, db_path=database.DB_PATH, workers=SCORING_WORKERS, drain_only=False):
+        self.evaluate = evaluate
+        self.complete = complete
+        self.fail = fail
+        self.db_path = db_path
+        self.workers = workers
+        self.drain_only = drain_only
+        self._wakeup = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        # The scoring_jobs table is created by the schema migrations
+        database.migrate(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self._recover(conn)
+        finally:
+            conn.close()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"scoring-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def notify(self):
+        """Wake the workers after new jobs were committed"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _recover(self, conn):
+        # Jobs claimed by a process that is no longer running go back to the queue. Our own
+        # pid counts too: no worker has started yet, so the claim is from an earlier process
+        # that had the same pid (e.g. PID 1 in a restarted container)
+        running = conn.execute("SELECT id, claimed_by FROM scoring_jobs WHERE state = 'running'").fetchall()
+        orphaned = [(job_id,) for job_id, pid in running
+                    if pid is None or pid == os.getpid() or not _pid_alive(pid)]
+        if orphaned:
+            conn.executemany("UPDATE scoring_jobs SET state = 'queued' WHERE id = ?", orphaned)
+            conn.commit()
+            print(f"Requeued {len(orphaned)} scoring jobs interrupted by a previous shutdown")
+
+    def _claim(self, conn):
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            job = conn.execute('''
+                SELECT id, txn_rowid, payload, attempts, result FROM scoring_jobs
+                WHERE state = 'queued' OR (state = 'running' AND claimed_at < ?)
+                ORDER BY id LIMIT 1
+            ''', (now - JOB_LEASE,)).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE scoring_jobs SET state = 'running', claimed_by = ?, claimed_at = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (os.getpid(), now, now, job[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return job
+
+    def _leased_here(self, conn):
+        """Whether a job claimed by this process is still running (or waiting out its lease)"""
+        return conn.execute("SELECT 1 FROM scoring_jobs WHERE state = 'running' AND claimed_by = ? LIMIT 1",
+                            (os.getpid(),)).fetchone() is not None
+
+    def _finish(self, conn, job_id, state, error=None):
+        conn.execute('UPDATE scoring_jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?',
+                     (state, error, time.time(), job_id))
+        conn.commit()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        while True:
+            try:
+                job = self._claim(conn)
+            except Exception as e:
+                print(f"Could not claim scoring job: {e}")
+                job = None
+            if job is None:
+                if self.drain_only and not self._leased_here(conn):
+                    conn.close()
+                    return
+                with self._wakeup:
+                    self._wakeup.wait(timeout=POLL_INTERVAL)
+                continue
+
+            try:
+                self._process(conn, *job)
+            except Exception as e:
+                # Recording the outcome failed (e.g. SQLite busy); the job stays running
+                # and is retried once its lease expires
+                print(f"Scoring job {job[0]} could not be recorded: {e}")
+
+    def _process(self, conn, job_id, txn_rowid, payload, attempts, result):
+        try:
+            if result is None:
+                result = self.evaluate(json.loads(payload))
+                conn.execute('UPDATE scoring_jobs SET result = ?, updated_at = ? WHERE id = ?',
+                             (result, time.time(), job_id))
+            self.complete(txn_rowid, result)
+            self._finish(conn, job_id, 'done')
+        except Exception as e:
+            if attempts + 1 >= MAX_ATTEMPTS:
+                print(f"Scoring job {job_id} failed permanently: {e}")
+                # Report first: if that fails, the job is retried rather than left failed on a pending row
+                self.fail(txn_rowid, str(e))
+                self._finish(conn, job_id, 'failed', str(e))
+            else:
+                self._finish(conn, job_id, 'queued', str(e))
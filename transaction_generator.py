@@ -46,20 +46,22 @@ def generate_suspicious_transaction():
     }
 
 def generate_circular_transactions():
-    """Generate a set of circular transactions (3 transactions that form a loop)"""
+    """Generate a set of circular transactions (6 transactions that form a loop)"""
     # Select 3 distinct employees and customers for the cycle
     cycle_emps = random.sample(employees[:5], 3)
     cycle_custs = random.sample(customers[:5], 3)
     
     # Create a circular pattern: emp1 -> cust1 -> emp2 -> cust2 -> emp3 -> cust3 -> emp1
+    # Each hop sends money from one party to the next, so the last hop closes the ring
+    ring = [party for pair in zip(cycle_emps, cycle_custs) for party in pair]
     transactions = []
     base_amount = random.randint(5000, 15000)
     
-    for i in range(3):
+    for i in range(len(ring)):
         tx = {
             "transaction_id": f"circ_{int(time.time())}_{random.randint(1000,9999)}_{i}",
-            "employee_id": cycle_emps[i],
-            "customer_id": cycle_custs[i],
+            "employee_id": ring[i],
+            "customer_id": ring[(i + 1) % len(ring)],
             "amount": base_amount + random.randint(-500, 500),
             "timestamp": datetime.now().isoformat(),
             "risk_score": random.uniform(0.7, 0.95)
@@ -0,0 +1,334 @@
+# vector_index.py
+import argparse
+import atexit
+import heapq
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+from urllib.parse import quote, unquote
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+
+import database
+
+INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "faiss_index")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+MANIFEST_FILE = "manifest.json"
+PARTITIONS_DIR = "partitions"  # one pickle per customer partition
+INDEX_FORMAT = 3  # bump when the on-disk layout changes; older layouts are rebuilt
+LOCK_FILE = ".lock"
+EMBED_BATCH_SIZE = 1000
+SAVE_INTERVAL = float(os.getenv("FAISS_SAVE_INTERVAL", "30"))  # seconds between background saves
+
+TRANSACTION_QUERY = database.history_query("rowid, ID, CustomerID, CustomerID2, Amount, Date, Time, IP")
+
+
+def transaction_to_document(row):
+    """Render a transactions row as a Document for the vector store"""
+    rowid, txn_id, customer_id, customer_id2, amount, date, time, ip = row
+    content = (
+        f"Transaction by {customer_id} to {customer_id2} of ${amount} on {date} at {time} from IP {ip}."
+    )
+    return Document(
+        page_content=content,
+        metadata={"txn_id": txn_id, "customer_id": customer_id, "rowid": rowid}
+    )
+
+
+class CustomerPartition:
+    """Exact (flat L2) FAISS index holding a single customer's transactions"""
+
+    def __init__(self, dim):
+        self.index = faiss.IndexFlatL2(dim)
+        self.docs = []
+
+    def add(self, vectors, docs):
+        self.index.add(vectors)
+        self.docs.extend(docs)
+
+    def search(self, query_vector, k):
+        """Return the k nearest (distance, Document) pairs, scanning only this partition"""
+        k = min(k, self.index.ntotal)
+        if k == 0:
+            return []
+        distances, positions = self.index.search(query_vector, k)
+        return [(float(d), self.docs[i]) for d, i in zip(distances[0], positions[0]) if i >= 0]
+
+    def __getstate__(self):
+        return {"index": faiss.serialize_index(self.index), "docs": self.docs}
+
+    def __setstate__(self, state):
+        self.index = faiss.deserialize_index(state["index"])
+        self.docs = state["docs"]
+
+
+class TransactionIndex:
+    """Vector index over the transactions table, partitioned by customer and persisted to disk.
+
+    Each customer gets its own flat FAISS index, so a lookup scans only that
+    customer's history and always returns their exact k nearest transactions,
+    no matter how large the rest of the corpus is.
+
+    The manifest records the embedding model and the highest rowid that has been
+    embedded, so a restart only embeds the rows added since the last save.
+    Each partition is saved to its own file, and a save rewrites only the
+    partitions that changed since the previous one.
+    """
+
+    def __init__(self, embeddings, model_name=EMBEDDING_MODEL, db_path=database.DB_PATH, index_dir=INDEX_DIR):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.db_path = db_path
+        self.index_dir = index_dir
+        self.partitions = {}
+        self.embedded_rowids = set()
+        self.last_rowid = 0
+        self._dirty = set()  # customers whose partition changed since the last save
+        # Guards the partitions against searches racing with appends and saves
+        self.lock = threading.RLock()
+        # Serializes syncs so two of them never embed the same rows
+        self._sync_lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST_FILE)
+
+    @property
+    def partitions_dir(self):
+        return os.path.join(self.index_dir, PARTITIONS_DIR)
+
+    def _partition_path(self, customer_id):
+        return os.path.join(self.partitions_dir, quote(str(customer_id), safe="") + ".pkl")
+
+    def load(self):
+        """Load the saved index if it matches the model, then embed any new rows"""
+        manifest = database.read_manifest(self.manifest_path)
+        if (manifest is None or manifest.get("model_name") != self.model_name
+                or manifest.get("format") != INDEX_FORMAT):
+            print("No usable vector index on disk, building from scratch.")
+            return self.rebuild()
+
+        partitions = {}
+        with self._file_lock():
+            for name in os.listdir(self.partitions_dir):
+                if name.endswith(".pkl"):
+                    with open(os.path.join(self.partitions_dir, name), "rb") as f:
+                        partitions[unquote(name[:-len(".pkl")])] = pickle.load(f)
+        with self.lock:
+            self.partitions = partitions
+            self._dirty = set()
+            self.embedded_rowids = {
+                doc.metadata["rowid"] for partition in partitions.values() for doc in partition.docs
+            }
+            self.last_rowid = manifest["last_rowid"]
+        added = self.sync()
+        print(f"Loaded vector index: {self.count()} transactions for "
+              f"{len(self.partitions)} customers ({added} newly embedded)")
+        return self
+
+    def rebuild(self):
+        """Drop the saved index and re-embed the whole transactions table"""
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        with self.lock:
+            self.partitions = {}
+            self.embedded_rowids = set()
+            self.last_rowid = 0
+            self._dirty = set()
+        added = self.sync()
+        print(f"Rebuilt vector index: {added} transactions embedded")
+        return self
+
+    def sync(self, save=True):
+        """Embed rows added since the last watermark, optionally saving if anything changed"""
+        with self._sync_lock:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.execute(TRANSACTION_QUERY, (self.last_rowid,))
+            added = 0
+            try:
+                while True:
+                    rows = cursor.fetchmany(EMBED_BATCH_SIZE)
+                    if not rows:
+                        break
+                    added += self._add_rows(rows)
+            finally:
+                conn.close()
+
+        if added and save:
+            self.save()
+        return added
+
+    def _add_rows(self, rows):
+        max_rowid = rows[-1][0]
+        # Skip rows that made it into the index but not the manifest (crash between writes)
+        with self.lock:
+            rows = [row for row in rows if row[0] not in self.embedded_rowids]
+        if not rows:
+            with self.lock:
+                self.last_rowid = max(self.last_rowid, max_rowid)
+            return 0
+
+        # Embed outside the lock so searches are not blocked by the model
+        docs = [transaction_to_document(row) for row in rows]
+        vectors = np.asarray(
+            self.embeddings.embed_documents([doc.page_content for doc in docs]), dtype="float32"
+        )
+
+        by_customer = {}
+        for position, doc in enumerate(docs):
+            by_customer.setdefault(doc.metadata["customer_id"], []).append(position)
+
+        with self.lock:
+            for customer_id, positions in by_customer.items():
+                partition = self.partitions.get(customer_id)
+                if partition is None:
+                    partition = self.partitions[customer_id] = CustomerPartition(vectors.shape[1])
+                partition.add(vectors[positions], [docs[i] for i in positions])
+                self._dirty.add(customer_id)
+            self.embedded_rowids.update(row[0] for row in rows)
+            self.last_rowid = max(self.last_rowid, max_rowid)
+        return len(rows)
+
+    def similarity_search(self, query, k=5, customer_id=None):
+        """Return the k transactions closest to the query.
+
+        With a customer_id only that customer's partition is searched; without one
+        every partition is searched and the results merged.
+        """
+        query_vector = np.asarray([self.embeddings.embed_query(query)], dtype="float32")
+        with self.lock:
+            if customer_id is not None:
+                partition = self.partitions.get(customer_id)
+                hits = partition.search(query_vector, k) if partition is not None else []
+            else:
+                hits = heapq.nsmallest(
+                    k,
+                    (hit for partition in self.partitions.values() for hit in partition.search(query_vector, k)),
+                    key=lambda hit: hit[0]
+                )
+        return [doc for _, doc in hits]
+
+    def count(self, customer_id=None):
+        with self.lock:
+            if customer_id is not None:
+                partition = self.partitions.get(customer_id)
+                return partition.index.ntotal if partition is not None else 0
+            return len(self.embedded_rowids)
+
+    def save(self):
+        """Write the changed partitions first and the manifest last.
+
+        Each partition file and the manifest are replaced atomically, so a crash
+        in between leaves partitions ahead of the manifest, which load() handles.
+        A file lock keeps concurrent worker processes from interleaving writes, and
+        a worker never overwrites an index that is further ahead than its own.
+        """
+        with self.lock:
+            if not self.partitions:
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            with self._file_lock():
+                manifest = database.read_manifest(self.manifest_path)
+                if (manifest and manifest.get("model_name") == self.model_name
+                        and manifest.get("format") == INDEX_FORMAT
+                        and manifest.get("last_rowid", 0) > self.last_rowid):
+                    return
+
+                os.makedirs(self.partitions_dir, exist_ok=True)
+                for customer_id in self._dirty:
+                    path = self._partition_path(customer_id)
+                    with open(path + ".tmp", "wb") as f:
+                        pickle.dump(self.partitions[customer_id], f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(path + ".tmp", path)
+
+                manifest = {
+                    "format": INDEX_FORMAT,
+                    "model_name": self.model_name,
+                    "last_rowid": self.last_rowid,
+                    "count": self.count(),
+                    "customers": len(self.partitions)
+                }
+                database.write_manifest(self.manifest_path, manifest)
+                self._dirty = set()
+
+    def _file_lock(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        return database.FileLock(os.path.join(self.index_dir, LOCK_FILE))
+
+
+class IndexUpdater:
+    """Background thread that folds newly inserted transactions into the live index.
+
+    `notify()` only sets a flag, so request handlers never wait on embedding. Bursts
+    of notifications collapse into a single sync, and saves to disk are throttled
+    to one per `save_interval` seconds (plus a final one at exit).
+    """
+
+    def __init__(self, index, save_interval=SAVE_INTERVAL):
+        self.index = index
+        self.save_interval = save_interval
+        self._pending = threading.Event()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="index-updater", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.flush)
+        return self
+
+    def notify(self):
+        """Signal that new rows were inserted into the transactions table"""
+        self._pending.set()
+
+    def flush(self):
+        """Embed any outstanding rows and save the index now"""
+        self.index.sync(save=False)
+        self.index.save()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _run(self):
+        while True:
+            triggered = self._pending.wait(timeout=self.save_interval)
+            self._pending.clear()
+            try:
+                if triggered and self.index.sync(save=False):
+                    self._dirty = True
+                if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+                    self.index.save()
+                    self._dirty = False
+                    self._last_save = time.monotonic()
+            except Exception as e:
+                print(f"Vector index update failed: {e}")
+
+
+class TransactionRetriever(BaseRetriever):
+    """Retriever over a TransactionIndex, optionally restricted to one customer's partition"""
+
+    index: Any
+    k: int = 5
+    customer_id: Optional[str] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.index.similarity_search(query, k=self.k, customer_id=self.customer_id)
+
+
+if __name__ == "__main__":
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    parser = argparse.ArgumentParser(description="Maintain the persisted transaction vector index")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="re-embed every transaction (use after changing the embedding model)")
+    args = parser.parse_args()
+
+    index = TransactionIndex(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL))
+    if args.rebuild:
+        index.rebuild()
+    else:
+        index.load()
@@ -0,0 +1,119 @@
+# verdict_cache.py
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "10000"))  # 0 disables the cache
+CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "3600"))  # seconds
+CACHE_DB = os.getenv("VERDICT_CACHE_DB")  # optional SQLite file for the persistent tier
+AMOUNT_BAND = float(os.getenv("VERDICT_CACHE_AMOUNT_BAND", "0.1"))  # relative width of an amount band
+HOUR_BUCKET = int(os.getenv("VERDICT_CACHE_HOUR_BUCKET", "1"))  # hours per time-of-day bucket
+
+
+class VerdictCache:
+    """LRU + TTL cache of LLM verdicts for near-identical transactions.
+
+    The key combines a feature bucket (customer, counterparty, IP, amount band
+    and hour bucket) with a fingerprint of the history retrieved for the
+    prompt, so a verdict is only reused when the model would have seen the
+    same context. An optional SQLite tier keeps verdicts across restarts.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, db_path=CACHE_DB,
+                 amount_band=AMOUNT_BAND, hour_bucket=HOUR_BUCKET):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if hour_bucket < 1:
+            raise ValueError(f"hour_bucket must be at least 1 hour, got {hour_bucket!r} (VERDICT_CACHE_HOUR_BUCKET)")
+        self.amount_band = amount_band
+        self.hour_bucket = hour_bucket
+        self.entries = OrderedDict()  # key -> (stored_at, response), oldest first
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.lock = threading.Lock()
+
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS verdict_cache
+                                 (key TEXT PRIMARY KEY, response TEXT, stored_at REAL)''')
+            self.conn.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, txn, docs):
+        """Cache key for a transaction and the history documents retrieved for it"""
+        amount = abs(float(txn["Amount"]))
+        band = math.floor(math.log(amount + 1) / math.log1p(self.amount_band)) if self.amount_band > 0 else amount
+        try:
+            hour = int(str(txn["Time"]).split(":")[0]) // self.hour_bucket
+        except ValueError:
+            hour = txn["Time"]
+        history = ",".join(sorted(str(doc.metadata.get("rowid")) for doc in docs))
+
+        raw = "|".join(str(part) for part in (
+            txn["CustomerID"], txn["CustomerID2"], txn["IP"], band, hour, history
+        ))
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+
+            if self.conn is not None:
+                row = self.conn.execute(
+                    'SELECT response, stored_at FROM verdict_cache WHERE key = ? AND stored_at >= ?',
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.persistent_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, response)
+            if self.conn is not None:
+                self.conn.execute('INSERT OR REPLACE INTO verdict_cache VALUES (?, ?, ?)', (key, response, now))
+                self.conn.execute('DELETE FROM verdict_cache WHERE stored_at < ?', (now - self.ttl,))
+                self.conn.commit()
+
+    def _remember(self, key, stored_at, response):
+        self.entries[key] = (stored_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "persistent_hits": self.persistent_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persistent": self.conn is not None
+            }